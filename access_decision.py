@@ -0,0 +1,61 @@
+# access_decision.py
+import collections
+import datetime
+
+GRANTED = "granted"
+DENIED = "denied"
+NO_ONE = "no_one"
+
+
+class AccessDecision:
+    """Per-door access state machine that votes over recent frame results.
+
+    Every frame casts one vote: (granted, name), (denied, None) or
+    (no_one, None). The door only changes state when one outcome holds at
+    least `min_votes` of the last `window` frames, so a single misread frame
+    can neither unlock the door nor flap it back to locked. update() returns
+    the new (state, user) on a transition and None otherwise, which is what
+    lets callers publish access events only when something actually changed.
+    """
+
+    def __init__(self, window=10, min_votes=6):
+        self.window = window
+        self.min_votes = min_votes
+        self.votes = collections.deque(maxlen=window)
+        self.state = NO_ONE
+        self.user = None
+
+    def update(self, recognized_name, is_recognized):
+        if recognized_name is None:
+            vote = (NO_ONE, None)
+        elif is_recognized:
+            vote = (GRANTED, recognized_name)
+        else:
+            vote = (DENIED, None)
+        self.votes.append(vote)
+
+        (state, user), count = collections.Counter(self.votes).most_common(1)[0]
+        if count < self.min_votes or (state, user) == (self.state, self.user):
+            return None
+        self.state, self.user = state, user
+        return state, user
+
+    def reset(self):
+        self.votes.clear()
+        self.state = NO_ONE
+        self.user = None
+
+
+def access_event(state, user, door=None):
+    """Build the smartlock/access payload for a decision transition"""
+    event = {"decision": state, "timestamp": datetime.datetime.now().isoformat()}
+    if state == NO_ONE:
+        # Doorway is empty again
+        event["type"] = "clear"
+    else:
+        event["type"] = "access"
+        event["authorized"] = state == GRANTED
+        event["user"] = user if state == GRANTED else "Unknown"
+    if door is not None:
+        event["door"] = door
+    return event
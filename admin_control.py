@@ -1,37 +1,56 @@
 # admin_control.py
+import argparse
 import tkinter as tk
 from tkinter import messagebox, ttk
 import cv2
 from PIL import Image, ImageTk
-import paho.mqtt.client as mqtt
 import json
-import base64
-import numpy as np
 import time
 import datetime
+import threading
+from mqtt_bus import get_bus
+from frame_codec import decode_frame, CAMERA_QOS
+from frame_pipeline import LatestQueue
+
+# How often the Tk main thread refreshes the camera view
+DISPLAY_FPS = 30
 
 class AdminControlPanel:
-    def __init__(self):
+    """Shows one door's camera feed and sends admin commands to that door.
+
+    Without a door it drives the single-camera setup (smartlock/camera,
+    smartlock/control); with one, a multi_camera.py door under
+    smartlock/<door>/.
+    """
+
+    def __init__(self, door=None):
+        self.door = door
+        prefix = f"smartlock/{door}" if door else "smartlock"
+        self.camera_topic = f"{prefix}/camera"
+        self.control_topic = f"{prefix}/control"
+        self.door_label = f" ({door})" if door else ""
+
         self.window = tk.Tk()
-        self.window.title("Admin Control Panel")
+        self.window.title(f"Admin Control Panel{self.door_label}")
         self.window.geometry("1200x720")
         
         # Flag to track if we've received camera frames yet
         self.received_frame = False
+
+        # Newest undecoded payload (filled by the MQTT thread) and newest
+        # decoded image (filled by the decode worker); older ones are dropped
+        self.payload_queue = LatestQueue(1)
+        self.image_queue = LatestQueue(1)
+        self.frames_received = 0
+        self.frames_displayed = 0
+        self.running = True
         
-        # MQTT Client Setup with updated client initialization
-        self.mqtt_client = mqtt.Client(client_id="AdminPanel")
-        try:
-            self.mqtt_client.connect("localhost", 1883)
-            self.mqtt_client.subscribe([
-                ("smartlock/camera", 1),  # Camera feed - QoS 1
-            ])
-            self.mqtt_client.on_message = self.on_message
-            self.mqtt_client.loop_start()
-            print("Connected to MQTT broker")
-        except ConnectionRefusedError:
+        # Shared MQTT bus: queued publishes, automatic reconnect and resubscribe
+        self.bus = get_bus("AdminPanel")
+        self.bus.subscribe(self.camera_topic, CAMERA_QOS, self.on_message)  # Camera feed - binary frames
+        if not self.bus.wait_connected(timeout=2):
             messagebox.showerror("MQTT Error", "Failed to connect to MQTT broker. Is Mosquitto running?")
-            print("Failed to connect to MQTT broker. Is Mosquitto running?")
+            print("Failed to connect to MQTT broker. Is Mosquitto running? (retrying in the background)")
         
         # Left side - Camera Feed
         self.camera_frame = tk.Frame(self.window, width=800, height=720)
@@ -105,11 +124,26 @@ class AdminControlPanel:
             bg="#f0f0f0"
         )
         self.emergency_status.pack(pady=10)
+
+        # Camera feed counters
+        self.feed_stats = tk.Label(
+            self.control_frame,
+            text="",
+            font=("Arial", 10),
+            bg="#f0f0f0",
+            fg="gray"
+        )
+        self.feed_stats.pack(pady=10)
         
         # Add a placeholder message in the camera area
-        self.camera_label.config(text="Waiting for camera feed from face recognition app...", 
+        self.camera_label.config(text="Waiting for camera feed from recognition_service.py...", 
                                 font=("Arial", 14))
         
+        # Decode off the MQTT thread, draw on the Tk main thread
+        self.decode_thread = threading.Thread(target=self.decode_frames, daemon=True)
+        self.decode_thread.start()
+        self.window.after(int(1000 / DISPLAY_FPS), self.refresh_camera)
+
         # Schedule a check for camera feed
         self.window.after(5000, self.check_camera_feed)
         
@@ -120,36 +154,63 @@ class AdminControlPanel:
         """Check if we've received any camera frames after 5 seconds"""
         if not self.received_frame:
             self.connection_status.config(
-                text="No camera feed received. Is face_recognition_app.py running?",
+                text=(f"No camera feed on {self.camera_topic}. Is recognition_service.py running?"
+                      if not self.door else
+                      f"No camera feed on {self.camera_topic}. Is multi_camera.py running this door?"),
                 fg="red"
             )
         self.window.after(5000, self.check_camera_feed)
     
     def on_message(self, client, userdata, msg):
         """Handle incoming MQTT messages"""
-        if msg.topic == "smartlock/camera":
+        if msg.topic == self.camera_topic:
+            # Only hand the payload over; decoding happens in decode_frames
+            self.frames_received += 1
+            self.payload_queue.put(msg.payload)
+
+    def decode_frames(self):
+        """Decode worker: always works on the newest payload"""
+        while self.running:
+            payload = self.payload_queue.get(timeout=0.5)
+            if payload is None:
+                continue
             try:
-                # Decode the image from base64
-                jpg_original = base64.b64decode(msg.payload)
-                np_arr = np.frombuffer(jpg_original, np.uint8)
-                frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+                # Decode the binary frame (header + JPEG bytes)
+                header, frame = decode_frame(payload)
                 
                 # Convert to RGB for display
                 frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                img = Image.fromarray(frame)
-                imgtk = ImageTk.PhotoImage(image=img)
-                self.camera_label.imgtk = imgtk
-                self.camera_label.configure(image=imgtk)
-                
-                # Update connection status if this is the first frame
-                if not self.received_frame:
-                    self.received_frame = True
-                    self.connection_status.config(
-                        text="Connected to camera feed",
-                        fg="green"
-                    )
+                self.image_queue.put(Image.fromarray(frame))
             except Exception as e:
                 print(f"Error processing camera frame: {e}")
+
+    def refresh_camera(self):
+        """Show the newest decoded frame; runs on the Tk main thread"""
+        img = self.image_queue.get(timeout=0)
+        if img is not None:
+            imgtk = ImageTk.PhotoImage(image=img)
+            self.camera_label.imgtk = imgtk
+            self.camera_label.configure(image=imgtk)
+            self.frames_displayed += 1
+
+            # Update connection status if this is the first frame
+            if not self.received_frame:
+                self.received_frame = True
+                self.connection_status.config(
+                    text="Connected to camera feed",
+                    fg="green"
+                )
+
+        dropped = self.payload_queue.dropped + self.image_queue.dropped
+        bus = self.bus.stats()
+        self.feed_stats.config(
+            text=f"Frames received: {self.frames_received}  "
+                 f"displayed: {self.frames_displayed}  dropped: {dropped}\n"
+                 f"MQTT: {'connected' if bus['connected'] else 'reconnecting'}  "
+                 f"backlog: {bus['backlog']}  reconnects: {bus['reconnects']}"
+        )
+        if self.running:
+            self.window.after(int(1000 / DISPLAY_FPS), self.refresh_camera)
     
     def accept_action(self):
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -162,16 +223,16 @@ class AdminControlPanel:
         self.emergency_status.config(text="")
         
         # Send unlock command with admin source
-        self.mqtt_client.publish("smartlock/control", 
-                               json.dumps({"command": "unlock", "source": "admin"}),
-                               qos=2)  # Control commands - QoS 2
+        self.bus.publish(self.control_topic,
+                         json.dumps({"command": "unlock", "source": "admin"}),
+                         qos=2)  # Control commands - QoS 2
         
         # Log the action
-        self.mqtt_client.publish("smartlock/system",
-                               json.dumps({
-                                   "type": "log",
-                                   "message": f"Unknown user allowed by admin at {timestamp}"
-                               }), qos=2)  # System logs - QoS 2
+        self.bus.publish("smartlock/system",
+                         json.dumps({
+                             "type": "log",
+                             "message": f"Unknown user allowed by admin{self.door_label} at {timestamp}"
+                         }), qos=2)  # System logs - QoS 2
         
         # Reset status after 3 seconds
         self.window.after(3000, lambda: self.status_label.config(text="System Ready", fg="black"))
@@ -190,16 +251,16 @@ class AdminControlPanel:
         )
         
         # Send lockdown command with admin source
-        self.mqtt_client.publish("smartlock/control",
-                               json.dumps({"command": "lockdown", "source": "admin"}),
-                               qos=2)  # Emergency commands - QoS 2
+        self.bus.publish(self.control_topic,
+                         json.dumps({"command": "lockdown", "source": "admin"}),
+                         qos=2)  # Emergency commands - QoS 2
         
         # Log the action
-        self.mqtt_client.publish("smartlock/system",
-                               json.dumps({
-                                   "type": "log",
-                                   "message": f"Unknown user denied by admin at {timestamp}"
-                               }), qos=2)  # System logs - QoS 2
+        self.bus.publish("smartlock/system",
+                         json.dumps({
+                             "type": "log",
+                             "message": f"Unknown user denied by admin{self.door_label} at {timestamp}"
+                         }), qos=2)  # System logs - QoS 2
         
         messagebox.showinfo("Access Denied", "Access has been denied. Emergency services have been contacted.")
         
@@ -207,8 +268,12 @@ class AdminControlPanel:
         self.window.after(3000, lambda: self.status_label.config(text="System Ready", fg="black"))
     
     def on_close(self):
-        self.mqtt_client.disconnect()
+        self.running = False
+        self.payload_queue.close()
+        self.bus.close()
         self.window.destroy()
 
 if __name__ == "__main__":
-    AdminControlPanel()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Smart lock admin control panel")
+    parser.add_argument("--door", help="Door name from multi_camera.py; omit for the single-camera setup")
+    AdminControlPanel(parser.parse_args().door)
\ No newline at end of file
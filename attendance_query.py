@@ -0,0 +1,279 @@
+# attendance_query.py
+"""Attendance and access analytics over attendance.db.
+
+system_logs.py stores every event in the `events` table (see
+event_store.py). Alongside each batch it also updates hourly and daily
+rollup tables per user, kind and outcome. The queries below read those
+rollups, so their cost depends on the number of hours/days asked for,
+not on the size of the history.
+
+    python attendance_query.py arrivals --from 2025-05-01 --to 2025-05-31
+    python attendance_query.py visits --user "Youssef Elgazar"
+    python attendance_query.py unknown-hourly --from 2025-05-15
+    python attendance_query.py events --from 2025-05-15 --kind control
+    python attendance_query.py rebuild
+"""
+import argparse
+import collections
+import datetime
+import functools
+import sqlite3
+import time
+
+DB_PATH = "attendance.db"
+
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollup_hourly (
+    hour TEXT NOT NULL,
+    user TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    first_ts REAL NOT NULL,
+    last_ts REAL NOT NULL,
+    PRIMARY KEY (hour, user, kind, outcome)
+);
+CREATE TABLE IF NOT EXISTS rollup_daily (
+    day TEXT NOT NULL,
+    user TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    first_ts REAL NOT NULL,
+    last_ts REAL NOT NULL,
+    PRIMARY KEY (day, user, kind, outcome)
+);
+CREATE INDEX IF NOT EXISTS idx_rollup_daily_user ON rollup_daily (user, day);
+CREATE INDEX IF NOT EXISTS idx_rollup_hourly_kind ON rollup_hourly (kind, outcome, hour);
+"""
+
+UPSERT = """
+INSERT INTO {table} ({bucket}, user, kind, outcome, count, first_ts, last_ts)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT ({bucket}, user, kind, outcome) DO UPDATE SET
+    count = count + excluded.count,
+    first_ts = MIN(first_ts, excluded.first_ts),
+    last_ts = MAX(last_ts, excluded.last_ts)
+"""
+
+
+# =========== ROLLUP MAINTENANCE ===========
+def ensure_schema(conn):
+    conn.executescript(ROLLUP_SCHEMA)
+
+
+@functools.lru_cache(maxsize=4096)
+def _bucket_keys(quarter):
+    # Local-time hour/day for a 15-minute slot; every UTC offset in use is a
+    # multiple of 15 minutes, so all timestamps in a slot share both keys
+    moment = datetime.datetime.fromtimestamp(quarter * 900)
+    return moment.strftime("%Y-%m-%d %H:00"), moment.strftime("%Y-%m-%d")
+
+
+def bucket_keys(ts):
+    """(hour, day) rollup keys of an epoch timestamp, in local time"""
+    return _bucket_keys(int(ts // 900))
+
+
+def apply_rollups(conn, rows):
+    """Fold a batch of event rows into the rollup tables.
+
+    Rows have the layout of event_store.INSERT: (ts, kind, topic, user,
+    outcome, message, payload, door). The batch is aggregated in memory first, so
+    each touched bucket costs a single upsert. Call it inside the same
+    transaction as the event insert so rollups never drift from events.
+    """
+    hourly = {}
+    daily = {}
+    for ts, kind, _, user, outcome, _, _, _ in rows:
+        key = (user or "", kind, outcome or "")
+        hour, day = bucket_keys(ts)
+        for buckets, bucket in ((hourly, hour), (daily, day)):
+            entry = buckets.get((bucket,) + key)
+            if entry is None:
+                buckets[(bucket,) + key] = [1, ts, ts]
+            else:
+                entry[0] += 1
+                entry[1] = min(entry[1], ts)
+                entry[2] = max(entry[2], ts)
+    for table, bucket, buckets in (("rollup_hourly", "hour", hourly), ("rollup_daily", "day", daily)):
+        conn.executemany(UPSERT.format(table=table, bucket=bucket),
+                         [key + tuple(value) for key, value in buckets.items()])
+
+
+def rebuild_rollups(conn, chunk=10000):
+    """Recompute all rollups from the events table (e.g. after an import)"""
+    with conn:
+        conn.execute("DELETE FROM rollup_hourly")
+        conn.execute("DELETE FROM rollup_daily")
+        cursor = conn.execute(
+            "SELECT ts, kind, topic, user, outcome, message, payload, door FROM events ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(chunk)
+            if not rows:
+                break
+            apply_rollups(conn, rows)
+
+
+# =========== QUERIES ===========
+def _day_range(start, end):
+    return start or "0000-00-00", end or "9999-99-99"
+
+
+def _ts_range(start, end):
+    """Convert YYYY-MM-DD[ HH:MM] bounds into epoch seconds (end inclusive by day)"""
+    def parse(value, default):
+        if not value:
+            return default
+        for fmt in ("%Y-%m-%d %H:%M", "%Y-%m-%d"):
+            try:
+                return datetime.datetime.strptime(value, fmt)
+            except ValueError:
+                continue
+        raise ValueError(f"Invalid date: {value}")
+    low = parse(start, None)
+    high = parse(end, None)
+    if high is not None and len(end) == 10:
+        high += datetime.timedelta(days=1)
+    return (low.timestamp() if low else 0.0), (high.timestamp() if high else float("inf"))
+
+
+class AttendanceQuery:
+    def __init__(self, path=DB_PATH):
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        ensure_schema(self.conn)
+
+    def close(self):
+        self.conn.close()
+
+    def arrivals(self, start=None, end=None, user=None):
+        """First and last granted access per user per day"""
+        low, high = _day_range(start, end)
+        sql = ("SELECT day, user, count, first_ts, last_ts FROM rollup_daily "
+               "WHERE kind = 'access' AND outcome = 'granted' AND day BETWEEN ? AND ?")
+        params = [low, high]
+        if user:
+            sql += " AND user = ?"
+            params.append(user)
+        rows = self.conn.execute(sql + " ORDER BY day, first_ts", params).fetchall()
+        return [{
+            "day": row["day"],
+            "user": row["user"],
+            "first_in": datetime.datetime.fromtimestamp(row["first_ts"]).strftime("%H:%M:%S"),
+            "last_in": datetime.datetime.fromtimestamp(row["last_ts"]).strftime("%H:%M:%S"),
+            "entries": row["count"],
+        } for row in rows]
+
+    def visits(self, start=None, end=None, user=None):
+        """How often each user came in: days present and total granted entries"""
+        low, high = _day_range(start, end)
+        sql = ("SELECT user, COUNT(*) AS days, SUM(count) AS entries, MIN(day) AS first_day, "
+               "MAX(day) AS last_day FROM rollup_daily "
+               "WHERE kind = 'access' AND outcome = 'granted' AND day BETWEEN ? AND ?")
+        params = [low, high]
+        if user:
+            sql += " AND user = ?"
+            params.append(user)
+        rows = self.conn.execute(sql + " GROUP BY user ORDER BY entries DESC", params).fetchall()
+        return [dict(row) for row in rows]
+
+    def unknown_hourly(self, start=None, end=None):
+        """Denied (unknown face) attempts per hour"""
+        low = f"{start} 00:00" if start and len(start) == 10 else (start or "0000")
+        high = f"{end} 23:59" if end and len(end) == 10 else (end or "9999")
+        rows = self.conn.execute(
+            "SELECT hour, SUM(count) AS attempts FROM rollup_hourly "
+            "WHERE kind = 'access' AND outcome = 'denied' AND hour BETWEEN ? AND ? "
+            "GROUP BY hour ORDER BY hour", (low, high)).fetchall()
+        return [dict(row) for row in rows]
+
+    def outcomes(self, start=None, end=None):
+        """Totals per kind and outcome over a day range"""
+        low, high = _day_range(start, end)
+        rows = self.conn.execute(
+            "SELECT kind, outcome, SUM(count) AS count FROM rollup_daily "
+            "WHERE day BETWEEN ? AND ? GROUP BY kind, outcome ORDER BY kind, outcome",
+            (low, high)).fetchall()
+        return [dict(row) for row in rows]
+
+    def events(self, start=None, end=None, user=None, kind=None, limit=100):
+        """Raw events in a time range (uses the ts / user / kind indexes)"""
+        low, high = _ts_range(start, end)
+        sql = "SELECT ts, kind, door, user, outcome, message FROM events WHERE ts >= ? AND ts < ?"
+        params = [low, high]
+        if user:
+            sql += " AND user = ?"
+            params.append(user)
+        if kind:
+            sql += " AND kind = ?"
+            params.append(kind)
+        sql += " ORDER BY ts DESC LIMIT ?"
+        params.append(limit)
+        return [dict(row, time=datetime.datetime.fromtimestamp(row["ts"]).strftime("%Y-%m-%d %H:%M:%S"))
+                for row in self.conn.execute(sql, params).fetchall()]
+
+
+# =========== CLI ===========
+def print_rows(rows, columns):
+    if not rows:
+        print("No results.")
+        return
+    widths = {c: max(len(c), *(len(str(row.get(c, ""))) for row in rows)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        print("  ".join(str(row.get(c, "")).ljust(widths[c]) for c in columns))
+
+
+COMMANDS = collections.OrderedDict([
+    ("arrivals", ("day", "user", "first_in", "last_in", "entries")),
+    ("visits", ("user", "days", "entries", "first_day", "last_day")),
+    ("unknown-hourly", ("hour", "attempts")),
+    ("outcomes", ("kind", "outcome", "count")),
+    ("events", ("time", "kind", "door", "user", "outcome", "message")),
+])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query smart lock attendance and access history")
+    parser.add_argument("command", choices=list(COMMANDS) + ["rebuild"])
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--from", dest="start", help="YYYY-MM-DD (events also accept 'YYYY-MM-DD HH:MM')")
+    parser.add_argument("--to", dest="end", help="YYYY-MM-DD, inclusive")
+    parser.add_argument("--user")
+    parser.add_argument("--kind", help="events only: access, presence, control or system")
+    parser.add_argument("--limit", type=int, default=100, help="events only")
+    args = parser.parse_args()
+
+    query = AttendanceQuery(args.db)
+    try:
+        run_command(query, args)
+    except sqlite3.OperationalError as e:
+        print(f"Query failed: {e}. Has system_logs.py recorded any events yet?")
+    finally:
+        query.close()
+
+
+def run_command(query, args):
+    started = time.perf_counter()
+    if args.command == "rebuild":
+        rebuild_rollups(query.conn)
+        print(f"Rollups rebuilt in {time.perf_counter() - started:.2f}s")
+        return
+    if args.command == "arrivals":
+        rows = query.arrivals(args.start, args.end, args.user)
+    elif args.command == "visits":
+        rows = query.visits(args.start, args.end, args.user)
+    elif args.command == "unknown-hourly":
+        rows = query.unknown_hourly(args.start, args.end)
+    elif args.command == "outcomes":
+        rows = query.outcomes(args.start, args.end)
+    else:
+        rows = query.events(args.start, args.end, args.user, args.kind, args.limit)
+    elapsed = (time.perf_counter() - started) * 1000
+    print_rows(rows, COMMANDS[args.command])
+    print(f"\n({len(rows)} rows in {elapsed:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+# benchmark.py
+"""Headless replay benchmark for the detection/recognition pipeline.
+
+Replays video files and/or image directories through the same
+detect -> square-crop -> predict code path as face_recognition_app.py and
+reports throughput, per-stage latency percentiles, peak memory and
+per-user recognition accuracy.
+
+Image directories laid out like data/data_faces_from_camera/<name>/*.jpg
+use the folder name as the ground-truth user, and so does a packed
+face_dataset .fds file (read straight from its memory map, no decoding).
+
+    python benchmark.py data/data_faces_from_camera --whole-image
+    python benchmark.py data/face_dataset.fds --whole-image
+    python benchmark.py door.mp4 --detection tracking --detect-every 5
+"""
+import argparse
+import collections
+import json
+import os
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from frame_pipeline import DETECT_PARAMS, CascadeDetector, create_face_cascade, recognize_faces
+from face_tracking import TrackingDetector
+from motion_gate import MotionGate
+import face_dataset
+from face_training import MODEL_PATH, LABEL_MAP_PATH, IMAGE_EXTENSIONS, load_recognizer
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv")
+STAGES = ("read", "convert", "detect", "recognize", "total")
+
+
+# =========== FRAME SOURCES ===========
+def iter_frames(paths):
+    """Yield (frame, ground_truth_name or None) from videos, image folders and datasets.
+
+    Frames are BGR, except dataset faces, which are already grayscale.
+    """
+    for path in paths:
+        if path.lower().endswith(face_dataset.EXTENSION):
+            dataset = face_dataset.load(path)
+            for name in dataset.names():
+                for face in dataset.faces(name):
+                    yield face, name
+        elif os.path.isdir(path):
+            for root, _, files in sorted(os.walk(path)):
+                truth = os.path.basename(root) if root != path else None
+                for file in sorted(files):
+                    if file.lower().endswith(IMAGE_EXTENSIONS):
+                        yield cv2.imread(os.path.join(root, file), cv2.IMREAD_COLOR), truth
+        elif path.lower().endswith(VIDEO_EXTENSIONS):
+            cap = cv2.VideoCapture(path)
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                yield frame, None
+            cap.release()
+        else:
+            yield cv2.imread(path, cv2.IMREAD_COLOR), None
+
+
+# =========== SETUP ===========
+def build_detector(args):
+    params = dict(DETECT_PARAMS, scaleFactor=args.scale_factor, minNeighbors=args.min_neighbors)
+    if args.detection == "tracking":
+        return TrackingDetector(create_face_cascade(), detect_every=args.detect_every,
+                                scale=args.detect_scale, params=params)
+    return CascadeDetector(create_face_cascade(), params=params)
+
+
+# =========== REPLAY ===========
+def run(args):
+    recognizer, label_map = load_recognizer(args.backend, args.model, args.labels)
+    if args.shortlist is not None and hasattr(recognizer, "shortlist"):
+        recognizer.shortlist = args.shortlist
+    detector = build_detector(args)
+    gate = MotionGate() if args.motion_gate else None
+
+    timings = {stage: [] for stage in STAGES}
+    per_user = collections.defaultdict(lambda: {"total": 0, "correct": 0, "no_face": 0})
+    frames = 0
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    source = iter_frames(args.sources)
+    while args.limit is None or frames < args.limit:
+        t0 = time.perf_counter()
+        try:
+            frame, truth = next(source)
+        except StopIteration:
+            break
+        if frame is None:
+            continue
+        # Gated frames are counted by the gate, not timed: nothing runs on them
+        if gate is not None and not gate.check(frame):
+            continue
+        t1 = time.perf_counter()
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        t2 = time.perf_counter()
+        if args.whole_image:
+            faces = [(0, 0, gray.shape[1], gray.shape[0])]
+        else:
+            faces = detector.detect(gray)
+        t3 = time.perf_counter()
+        boxes, recognized_name, _ = recognize_faces(gray, faces, recognizer, label_map)
+        t4 = time.perf_counter()
+        if boxes and gate is not None:
+            gate.hold()
+
+        for stage, seconds in zip(STAGES, (t1 - t0, t2 - t1, t3 - t2, t4 - t3, t4 - t0)):
+            timings[stage].append(seconds * 1000)
+        frames += 1
+
+        if truth is not None:
+            stats = per_user[truth]
+            stats["total"] += 1
+            if recognized_name is None:
+                stats["no_face"] += 1
+            elif recognized_name == truth:
+                stats["correct"] += 1
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    report = {
+        "frames": frames,
+        "seconds": elapsed,
+        "fps": frames / elapsed if elapsed else 0.0,
+        "peak_memory_mb": peak / (1024 * 1024),
+        "latency_ms": {
+            stage: {
+                "p50": float(np.percentile(values, 50)),
+                "p90": float(np.percentile(values, 90)),
+                "p99": float(np.percentile(values, 99)),
+                "max": float(np.max(values)),
+            } for stage, values in timings.items() if values
+        },
+        "accuracy": {
+            name: dict(stats, accuracy=stats["correct"] / stats["total"])
+            for name, stats in sorted(per_user.items())
+        },
+    }
+    try:
+        import resource
+        # ru_maxrss also covers OpenCV's native allocations (KiB on Linux)
+        report["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        pass  # Not available on Windows
+    if hasattr(detector, "stats"):
+        report["detector"] = detector.stats()
+    if gate is not None:
+        report["motion_gate"] = gate.stats()
+    return report
+
+
+def print_report(report):
+    print(f"Frames: {report['frames']}  Time: {report['seconds']:.2f}s  FPS: {report['fps']:.1f}")
+    memory = f"Peak Python memory: {report['peak_memory_mb']:.1f} MB"
+    if "max_rss_mb" in report:
+        memory += f"  Max RSS: {report['max_rss_mb']:.1f} MB"
+    print(memory)
+    print()
+    print(f"{'stage':<10} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for stage, values in report["latency_ms"].items():
+        print(f"{stage:<10} {values['p50']:>9.2f} {values['p90']:>9.2f} {values['p99']:>9.2f} {values['max']:>9.2f}")
+    for key, title in (("detector", "Detector"), ("motion_gate", "Motion gate")):
+        if report.get(key):
+            print()
+            print(f"{title}:", ", ".join(f"{k}={v:.2f}" if isinstance(v, float) else f"{k}={v}"
+                                         for k, v in report[key].items()))
+    if report["accuracy"]:
+        print()
+        print(f"{'user':<24} {'frames':>7} {'correct':>8} {'no face':>8} {'accuracy':>9}")
+        for name, stats in report["accuracy"].items():
+            print(f"{name:<24} {stats['total']:>7} {stats['correct']:>8} {stats['no_face']:>8} {stats['accuracy']:>8.1%}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay benchmark for the face recognition pipeline")
+    parser.add_argument("sources", nargs="+", help="Video files, image files, image directories or .fds datasets")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--labels", default=LABEL_MAP_PATH)
+    parser.add_argument("--backend", choices=("opencv", "numpy"), default="opencv")
+    parser.add_argument("--shortlist", type=int,
+                        help="numpy backend: people matched in full after the centroid pass (0 = exhaustive)")
+    parser.add_argument("--detection", choices=("full", "tracking"), default="full")
+    parser.add_argument("--detect-every", type=int, default=5)
+    parser.add_argument("--detect-scale", type=float, default=0.5)
+    parser.add_argument("--scale-factor", type=float, default=DETECT_PARAMS["scaleFactor"])
+    parser.add_argument("--min-neighbors", type=int, default=DETECT_PARAMS["minNeighbors"])
+    parser.add_argument("--whole-image", action="store_true",
+                        help="Skip detection and treat each image as one face (pre-cropped enrollment images)")
+    parser.add_argument("--motion-gate", action="store_true",
+                        help="Skip detection on frames without motion, as recognition_service does")
+    parser.add_argument("--limit", type=int, help="Stop after this many frames")
+    parser.add_argument("--json", help="Also write the report to this JSON file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
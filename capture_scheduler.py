@@ -0,0 +1,118 @@
+# capture_scheduler.py
+import time
+import cv2
+
+
+class CaptureProfile:
+    """Camera resolution and frame rate for one activity level"""
+
+    def __init__(self, name, width, height, fps):
+        self.name = name
+        self.width = width
+        self.height = height
+        self.fps = fps
+
+
+# An empty doorway only needs enough pixels and frames to notice motion
+IDLE_PROFILE = CaptureProfile("idle", 320, 240, 5)
+ACTIVE_PROFILE = CaptureProfile("active", 640, 480, 30)
+
+
+class CaptureScheduler:
+    """Switches a cv2.VideoCapture between an idle and an active profile.
+
+    The camera runs the active profile while there is activity (motion or a
+    face in view) and drops to the idle profile `idle_after` seconds after
+    the last of it. Going active happens on the first frame with activity;
+    going idle again waits at least `min_active` seconds, so a profile
+    switch (which restarts the camera stream on most drivers) never flaps.
+
+    Within a profile the capture rate also follows the measured per-frame
+    processing time: reading more frames than `workers` can process only
+    burns CPU on frames that get dropped, so wait() paces reads to
+    min(profile fps, workers / processing time).
+
+    update() and wait() belong to the capture thread; note_activity() and
+    observe_processing() may be called from any worker.
+    """
+
+    def __init__(self, idle=IDLE_PROFILE, active=ACTIVE_PROFILE, idle_after=10.0,
+                 min_active=5.0, workers=1, smoothing=0.1):
+        self.idle = idle
+        self.active = active
+        self.idle_after = idle_after
+        self.min_active = min_active
+        self.workers = max(1, workers)
+        self.smoothing = smoothing
+
+        self.profile = None
+        self.switched_at = 0.0
+        self.last_activity = 0.0
+        self.processing_time = None  # Moving average, seconds per frame
+        self.next_read = 0.0
+        self.switches = 0
+
+    def start(self, cap, now=None):
+        """Open in the active profile, so someone already at the door is served at once"""
+        now = time.time() if now is None else now
+        self.last_activity = now
+        self._apply(cap, self.active, now)
+
+    def note_activity(self, now=None):
+        self.last_activity = time.time() if now is None else now
+
+    def observe_processing(self, seconds):
+        if self.processing_time is None:
+            self.processing_time = seconds
+        else:
+            self.processing_time += self.smoothing * (seconds - self.processing_time)
+
+    def target_fps(self):
+        fps = self.profile.fps if self.profile is not None else self.active.fps
+        if self.processing_time:
+            fps = min(fps, self.workers / self.processing_time)
+        return max(1.0, fps)
+
+    def update(self, cap, activity, now=None):
+        """Pick the profile for the next frames; returns True if it changed"""
+        now = time.time() if now is None else now
+        if activity:
+            self.last_activity = now
+        if now - self.last_activity < self.idle_after:
+            wanted = self.active
+        elif now - self.switched_at >= self.min_active:
+            wanted = self.idle
+        else:
+            wanted = self.profile
+        if wanted is self.profile:
+            return False
+        self._apply(cap, wanted, now)
+        return True
+
+    def wait(self):
+        """Sleep until the next frame is due at the current target rate"""
+        now = time.time()
+        if self.next_read > now:
+            time.sleep(self.next_read - now)
+            now = self.next_read
+        self.next_read = now + 1.0 / self.target_fps()
+
+    def _apply(self, cap, profile, now):
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, profile.width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, profile.height)
+        cap.set(cv2.CAP_PROP_FPS, profile.fps)
+        # Paced reads would otherwise be served stale frames from the driver queue
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.profile = profile
+        self.switched_at = now
+        self.next_read = 0.0
+        self.switches += 1
+        print(f"Capture profile: {profile.name} ({profile.width}x{profile.height} @ {profile.fps} fps)")
+
+    def stats(self):
+        return {
+            "profile": self.profile.name if self.profile is not None else None,
+            "target_fps": self.target_fps(),
+            "processing_ms": 1000 * self.processing_time if self.processing_time else 0.0,
+            "switches": self.switches,
+        }
@@ -0,0 +1,158 @@
+# compaction.py
+"""Per-person prototype compaction of the LBPH gallery.
+
+Enrollment keeps ~40 crops of each person, most of them nearly identical,
+and every one becomes a histogram the recognizer stores, loads and matches
+against. Compaction clusters each person's histograms with k-means and
+keeps only the cluster centers, so the model holds a few prototypes per
+person instead.
+
+The report trains a full and a compacted model on the enrollment faces
+minus a held-out part (every HOLDOUT_EVERY-th face of each person) and
+compares their size, matching latency and accuracy on the held-out faces.
+Histograms come from the face dataset cache, so nothing is decoded.
+
+    python compaction.py --prototypes 8            # report only
+    python compaction.py --prototypes 8 --write    # retrain with compaction
+    python compaction.py --prototypes 0 --write    # back to every sample
+
+--write records the count with the model, so later retrains (enrolling
+someone) keep the compaction.
+"""
+import argparse
+import time
+import cv2
+import numpy as np
+from lbp_gallery import LBPGallery, HIST_SIZE
+from frame_pipeline import CONFIDENCE_THRESHOLD
+
+# ==================================================================
+# Index:
+#   - PROTOTYPES
+#   - EVALUATION
+#   - CLI
+# ==================================================================
+
+HOLDOUT_EVERY = 5
+KMEANS_ATTEMPTS = 3
+KMEANS_CRITERIA = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 50, 1e-4)
+
+
+# =========== PROTOTYPES ===========
+def prototypes(histograms, count):
+    """Reduce one person's (samples x HIST_SIZE) histograms to `count` k-means centers"""
+    histograms = np.asarray(histograms, dtype=np.float32)
+    if len(histograms) <= count:
+        return histograms.copy()
+    cv2.setRNGSeed(0)  # Same model from the same faces
+    _, _, centers = cv2.kmeans(histograms, count, None, KMEANS_CRITERIA,
+                               KMEANS_ATTEMPTS, cv2.KMEANS_PP_CENTERS)
+    return centers
+
+
+def build_gallery(people, count=0):
+    """LBPGallery from [(label, histograms)], compacted to `count` per person if set"""
+    histograms = []
+    labels = []
+    for label, person_histograms in people:
+        if count:
+            person_histograms = prototypes(person_histograms, count)
+        histograms.append(person_histograms)
+        labels.extend([label] * len(person_histograms))
+    if not labels:
+        return LBPGallery(np.zeros((0, HIST_SIZE), np.float32), [])
+    return LBPGallery(np.concatenate(histograms), labels)
+
+
+# =========== EVALUATION ===========
+def evaluate(gallery, queries, truth):
+    """Size, per-face matching latency and accuracy of a gallery on held-out histograms"""
+    correct = 0
+    started = time.perf_counter()
+    for query, label in zip(queries, truth):
+        predicted, confidence = gallery.predict_histograms(query[None, :])[0]
+        if predicted == label and confidence < CONFIDENCE_THRESHOLD:
+            correct += 1
+    elapsed = time.perf_counter() - started
+    return {
+        "histograms": len(gallery),
+        "size_mb": len(gallery) * HIST_SIZE * 4 / (1024 * 1024),
+        "latency_ms": elapsed * 1000 / max(1, len(queries)),
+        "accuracy": correct / len(queries) if len(queries) else 0.0,
+    }
+
+
+def report(dataset, label_ids, count, holdout_every=HOLDOUT_EVERY):
+    """Compare a full and a `count`-prototype model on held-out enrollment faces"""
+    train = []
+    queries = []
+    truth = []
+    for name in dataset.names():
+        histograms = np.asarray(dataset.person_histograms(name))
+        if name not in label_ids or not len(histograms):
+            continue
+        held = np.arange(len(histograms)) % holdout_every == 0
+        if held.all():
+            held[:] = False  # Too few faces to hold any out
+        train.append((label_ids[name], histograms[~held]))
+        queries.extend(histograms[held])
+        truth.extend([label_ids[name]] * int(held.sum()))
+
+    started = time.perf_counter()
+    compact = build_gallery(train, count)
+    build_seconds = time.perf_counter() - started
+    return {
+        "people": len(train),
+        "held_out": len(queries),
+        "prototypes": count,
+        "compaction_seconds": build_seconds,
+        "full": evaluate(build_gallery(train), queries, truth),
+        "compact": evaluate(compact, queries, truth),
+    }
+
+
+def print_report(result):
+    print(f"People: {result['people']}  Held-out faces: {result['held_out']}  "
+          f"Prototypes per person: {result['prototypes']}  "
+          f"(k-means took {result['compaction_seconds']:.2f}s)")
+    print()
+    print(f"{'model':<9} {'histograms':>10} {'size MB':>9} {'ms/face':>8} {'accuracy':>9}")
+    for model in ("full", "compact"):
+        stats = result[model]
+        print(f"{model:<9} {stats['histograms']:>10} {stats['size_mb']:>9.2f} "
+              f"{stats['latency_ms']:>8.2f} {stats['accuracy']:>8.1%}")
+    full, compact = result["full"], result["compact"]
+    if full["histograms"] and compact["latency_ms"]:
+        print()
+        print(f"Size: {compact['histograms'] / full['histograms']:.0%} of full, "
+              f"matching {full['latency_ms'] / compact['latency_ms']:.1f}x faster, "
+              f"accuracy {100 * (compact['accuracy'] - full['accuracy']):+.1f} points")
+
+
+# =========== CLI ===========
+def main():
+    import face_training
+
+    parser = argparse.ArgumentParser(description="Compact the LBPH gallery to a few prototypes per person")
+    parser.add_argument("--prototypes", type=int, default=8, help="Prototypes kept per person")
+    parser.add_argument("--holdout-every", type=int, default=HOLDOUT_EVERY,
+                        help="Hold out every N-th face of each person for the report")
+    parser.add_argument("--write", action="store_true",
+                        help="Retrain the model from all faces with this compaction and keep it for later retrains")
+    args = parser.parse_args()
+
+    dataset = face_training.load_dataset()
+    label_ids = face_training.load_label_ids()
+    if not label_ids:
+        label_ids = {name: i for i, name in enumerate(dataset.names())}
+    print_report(report(dataset, label_ids, args.prototypes, args.holdout_every))
+
+    if args.write:
+        label_ids = face_training.train_full(prototypes=args.prototypes)
+        if label_ids:
+            print()
+            print(f"Wrote {face_training.MODEL_PATH} with {args.prototypes or 'all'} prototypes per person")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# enrollment.py
+import os
+import threading
+import cv2
+import numpy as np
+
+# ==================================================================
+# Index:
+#   - QUALITY SCORES
+#   - BURST SELECTION
+#   - BACKGROUND WRITER
+# ==================================================================
+
+# Hard floor (pixels, shorter side): the detector's own minSize, so anyone
+# who can be detected can enroll. Above it, size only lowers the score
+MIN_FACE_SIZE = 30
+# Size at which a face gets the full size score
+GOOD_FACE_SIZE = 160
+# Mean brightness outside this range means an under/over-exposed face
+MIN_BRIGHTNESS = 40
+MAX_BRIGHTNESS = 215
+# Candidates sharper than this fraction of the burst's median are kept; the
+# rest are motion-blurred
+MIN_SHARPNESS_RATIO = 0.35
+# Two faces whose thumbnails differ by less than this (mean absolute
+# difference, 0..1) are near-duplicates
+DUPLICATE_DISTANCE = 0.04
+THUMB_SIZE = 24
+
+
+# =========== QUALITY SCORES ===========
+def sharpness(face):
+    """Variance of the Laplacian on a fixed-size copy (higher = sharper)"""
+    return float(cv2.Laplacian(cv2.resize(face, (100, 100)), cv2.CV_64F).var())
+
+
+def thumbnail(face):
+    """Small, contrast-normalized copy used to compare faces with each other"""
+    small = cv2.equalizeHist(cv2.resize(face, (THUMB_SIZE, THUMB_SIZE)))
+    return small.astype(np.float32) / 255.0
+
+
+class Candidate:
+    """One detected face crop from the burst with its quality measures"""
+
+    def __init__(self, face):
+        self.face = face
+        self.size = min(face.shape[:2])
+        self.brightness = float(face.mean())
+        self.sharpness = sharpness(face)
+        self.thumb = thumbnail(face)
+        self.score = 0.0
+
+
+# =========== BURST SELECTION ===========
+class BurstSelector:
+    """Collects face crops at camera rate and keeps the best diverse ones.
+
+    add() rejects badly exposed crops (and any below the detector's
+    minimum size) outright; small faces are kept but score lower. Once
+    the burst is over, select() drops motion-blurred crops (relative to the
+    burst's median sharpness), ranks the rest by sharpness, size and
+    exposure, and greedily keeps the best crops that are not near-duplicates
+    of one already kept. If that leaves fewer than `target`, the
+    best remaining crops fill up the set.
+    """
+
+    def __init__(self, target=40, max_candidates=120):
+        self.target = target
+        self.max_candidates = max_candidates
+        self.candidates = []
+        self.rejected = 0
+
+    @property
+    def full(self):
+        return len(self.candidates) >= self.max_candidates
+
+    def add(self, face):
+        """Offer a grayscale face crop; returns True if it became a candidate"""
+        if min(face.shape[:2]) < MIN_FACE_SIZE:
+            self.rejected += 1
+            return False
+        brightness = float(face.mean())
+        if brightness < MIN_BRIGHTNESS or brightness > MAX_BRIGHTNESS:
+            self.rejected += 1
+            return False
+        self.candidates.append(Candidate(face))
+        return True
+
+    def select(self):
+        """Return up to `target` face crops, best first"""
+        if not self.candidates:
+            return []
+        median_sharpness = float(np.median([c.sharpness for c in self.candidates]))
+        usable = [c for c in self.candidates if c.sharpness >= MIN_SHARPNESS_RATIO * median_sharpness]
+        max_sharpness = max(c.sharpness for c in usable) or 1.0
+        for c in usable:
+            exposure = 1.0 - abs(c.brightness - 128.0) / 128.0
+            c.score = (0.5 * c.sharpness / max_sharpness
+                       + 0.3 * min(1.0, c.size / GOOD_FACE_SIZE)
+                       + 0.2 * exposure)
+        usable.sort(key=lambda c: c.score, reverse=True)
+
+        kept = []
+        skipped = []
+        for c in usable:
+            if len(kept) >= self.target:
+                break
+            if all(np.abs(c.thumb - k.thumb).mean() >= DUPLICATE_DISTANCE for k in kept):
+                kept.append(c)
+            else:
+                skipped.append(c)
+        # Too few distinct crops (e.g. someone standing very still): top up
+        kept.extend(skipped[:self.target - len(kept)])
+        return [c.face for c in kept]
+
+
+# =========== BACKGROUND WRITER ===========
+class BackgroundWriter:
+    """Writes a person's selected faces in one batch off the UI thread.
+
+    Images from an earlier enrollment of the same person are removed first,
+    so the folder holds exactly the new set. Poll `done` from the UI.
+    """
+
+    def __init__(self, person_dir, faces):
+        self.person_dir = person_dir
+        self.faces = faces
+        self.paths = []
+        self.error = None
+        self.done = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _run(self):
+        try:
+            os.makedirs(self.person_dir, exist_ok=True)
+            for file in os.listdir(self.person_dir):
+                if file.startswith("face_") and file.endswith(".jpg"):
+                    os.remove(os.path.join(self.person_dir, file))
+            for index, face in enumerate(self.faces, start=1):
+                path = os.path.join(self.person_dir, f"face_{index}.jpg")
+                cv2.imwrite(path, face)
+                self.paths.append(path)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
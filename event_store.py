@@ -0,0 +1,112 @@
+# event_store.py
+import json
+import queue
+import sqlite3
+import threading
+import time
+import attendance_query
+
+DB_PATH = "attendance.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    kind TEXT NOT NULL,
+    topic TEXT,
+    user TEXT,
+    outcome TEXT,
+    message TEXT,
+    payload TEXT,
+    door TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS idx_events_user_ts ON events (user, ts);
+CREATE INDEX IF NOT EXISTS idx_events_kind_ts ON events (kind, ts);
+"""
+
+INSERT = ("INSERT INTO events (ts, kind, topic, user, outcome, message, payload, door) "
+          "VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+
+
+class EventStore:
+    """Persists events to SQLite from a dedicated writer thread.
+
+    record() only puts a row on an in-memory queue, so MQTT callbacks never
+    wait on disk. The writer drains whatever has queued up (up to
+    batch_size rows) and inserts it in a single transaction, together with
+    the matching hourly/daily rollup updates. The database runs in WAL mode
+    so readers don't block the writer.
+    """
+
+    def __init__(self, path=DB_PATH, batch_size=256, max_pending=100000):
+        self.path = path
+        self.batch_size = batch_size
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.dropped = 0
+        self.written = 0
+        self.thread = None
+        self._stop = object()
+
+    def open(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        # Databases created before multi-door support have no door column
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(events)")]
+        if "door" not in columns:
+            conn.execute("ALTER TABLE events ADD COLUMN door TEXT")
+        attendance_query.ensure_schema(conn)
+        return conn
+
+    def start(self):
+        # Create the schema up front so errors surface in the caller
+        self.open().close()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def record(self, kind, topic=None, user=None, outcome=None, message=None, payload=None, ts=None,
+               door=None):
+        if isinstance(payload, dict):
+            payload = json.dumps(payload)
+        row = (ts if ts is not None else time.time(), kind, topic, user, outcome, message, payload, door)
+        try:
+            self.pending.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        if self.thread is None:
+            return
+        self.pending.put(self._stop)
+        self.thread.join()
+        self.thread = None
+
+    def _run(self):
+        conn = self.open()
+        try:
+            while True:
+                batch = [self.pending.get()]
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self.pending.get_nowait())
+                    except queue.Empty:
+                        break
+                stopping = self._stop in batch
+                rows = [row for row in batch if row is not self._stop]
+                if rows:
+                    self._write(conn, rows)
+                if stopping:
+                    break
+        finally:
+            conn.close()
+
+    def _write(self, conn, rows):
+        try:
+            with conn:
+                conn.executemany(INSERT, rows)
+                attendance_query.apply_rollups(conn, rows)
+            self.written += len(rows)
+        except sqlite3.Error as e:
+            print(f"Error writing {len(rows)} events: {e}")
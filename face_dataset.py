@@ -0,0 +1,389 @@
+# face_dataset.py
+"""Packed face dataset: every enrollment crop in one memory-mapped file.
+
+The enrollment folders (data/data_faces_from_camera/<name>/face_N.jpg) stay
+the place where faces are captured and removed, but decoding thousands of
+JPEGs on every retrain or benchmark run is slow and every file costs a
+directory entry. The .fds file holds the same faces as fixed-size
+grayscale crops in one uint8 array, indexed by person, so reading a
+person's faces is a slice of a memory map. Next to every crop it keeps the
+crop's LBP histogram, so training never recomputes one either.
+
+Layout (every array starts on a 64-byte boundary):
+
+    header      HEADER struct below
+    index       UTF-8 JSON: format, creation time, FACE_SIZE and one
+                {name, offset, count, files, failed} entry per person, where
+                files lists [file name, size, mtime_ns, sha1] for each face
+                and failed [file name, size, mtime_ns] for each unreadable image
+    images      uint8[count, face_size, face_size]
+    histograms  float32[count, hist_size]
+
+The file doubles as a cache of the preprocessing. sync() reuses a face when
+its image file has the same size and mtime as before, or, failing that, the
+same content hash as any face already in the file (a copied or renamed
+image); only new or changed images are decoded. Images that cannot be
+decoded are remembered by size and mtime and skipped until they change.
+Faces whose file or person folder is gone are evicted.
+
+    python face_dataset.py import                 # folders -> data/face_dataset.fds
+    python face_dataset.py export out/faces       # .fds -> <name>/face_N.png folders
+    python face_dataset.py info
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from lbp_gallery import HIST_SIZE, lbp_histogram
+from model_store import MMAP_DEFAULT
+
+# ==================================================================
+# Index:
+#   - NORMALIZATION
+#   - FACE DATASET
+#   - WRITE
+#   - READ
+#   - FOLDER IMPORT / EXPORT
+#   - CLI
+# ==================================================================
+
+FACE_DIR = "data/data_faces_from_camera"
+DATASET_PATH = "data/face_dataset.fds"
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+MAGIC = b"FDS1"
+FORMAT_VERSION = 2
+ALIGN = 64
+EXTENSION = ".fds"
+# Side of the stored square crops; enrollment crops are ~150-300 px, and
+# LBPH histograms are normalized per grid cell, so little is lost
+FACE_SIZE = 128
+# Bumped whenever normalize_face() changes, so older files are re-decoded
+PREPROCESS_VERSION = 2
+# Threads decoding images in sync(); cv2 releases the GIL while decoding
+LOAD_WORKERS = min(8, os.cpu_count() or 1)
+
+#   magic 4s, version H, flags H, face_size I, hist_size I, count I, index length I
+HEADER = struct.Struct("<4sHHIIII")
+
+
+# =========== NORMALIZATION ===========
+def normalize_face(gray, size=FACE_SIZE):
+    """Canonical form of a grayscale face crop, for training and recognition alike.
+
+    Center square crop, resize to size x size, histogram equalization.
+    """
+    rows, cols = gray.shape[:2]
+    side = min(rows, cols)
+    top, left = (rows - side) // 2, (cols - side) // 2
+    face = gray[top:top + side, left:left + side]
+    if side != size:
+        interpolation = cv2.INTER_AREA if side > size else cv2.INTER_LINEAR
+        face = cv2.resize(face, (size, size), interpolation=interpolation)
+    return cv2.equalizeHist(face)
+
+
+# =========== FACE DATASET ===========
+class FaceDataset:
+    """Face crops and histograms of every person, read as slices of two arrays"""
+
+    def __init__(self, images, histograms, people, face_size=FACE_SIZE, preprocess=PREPROCESS_VERSION):
+        self.images = images
+        self.histograms = histograms
+        self.people = people  # [{name, offset, count, files, failed}]
+        self.face_size = face_size
+        self.preprocess = preprocess
+        self.index = {person["name"]: person for person in people}
+
+    def __len__(self):
+        return len(self.images)
+
+    def names(self):
+        return [person["name"] for person in self.people]
+
+    def _rows(self, name):
+        person = self.index.get(name)
+        if person is None:
+            return slice(0, 0)
+        return slice(person["offset"], person["offset"] + person["count"])
+
+    def faces(self, name):
+        """(count, face_size, face_size) view of one person's crops"""
+        return self.images[self._rows(name)]
+
+    def person_histograms(self, name):
+        """(count, HIST_SIZE) view of one person's LBP histograms"""
+        return self.histograms[self._rows(name)]
+
+    @property
+    def reusable(self):
+        """False when the file was built with other preprocessing and must be redone"""
+        return self.face_size == FACE_SIZE and self.preprocess == PREPROCESS_VERSION
+
+    def file_records(self):
+        """{(name, file): (size, mtime_ns, sha1, row)} for every stored face"""
+        records = {}
+        for person in self.people:
+            for i, (file, size, mtime_ns, sha1) in enumerate(person["files"]):
+                records[(person["name"], file)] = (size, mtime_ns, sha1, person["offset"] + i)
+        return records
+
+    def failed_records(self):
+        """{(name, file): (size, mtime_ns)} for every image that could not be decoded"""
+        return {(person["name"], file): (size, mtime_ns)
+                for person in self.people
+                for file, size, mtime_ns in person.get("failed", [])}
+
+
+def empty_dataset(face_size=FACE_SIZE):
+    return FaceDataset(np.zeros((0, face_size, face_size), np.uint8),
+                       np.zeros((0, HIST_SIZE), np.float32), [], face_size)
+
+
+# =========== WRITE ===========
+def _align(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _layout(count, face_size, index_len):
+    """Byte offsets of (images, histograms) and the total file size"""
+    images = _align(HEADER.size + index_len)
+    histograms = _align(images + count * face_size * face_size)
+    return images, histograms, histograms + 4 * count * HIST_SIZE
+
+
+def save(path, blocks, face_size=FACE_SIZE):
+    """Write [(name, files, faces, histograms, failed)] to `path` atomically.
+
+    Blocks are streamed straight to the file, so a new dataset never has to
+    be assembled in memory.
+    """
+    people = []
+    offset = 0
+    for name, files, faces, _, failed in blocks:
+        people.append({"name": name, "offset": offset, "count": len(faces), "files": files,
+                       "failed": failed})
+        offset += len(faces)
+    index = json.dumps({"format": FORMAT_VERSION, "created": datetime.datetime.now().isoformat(),
+                        "face_size": face_size, "preprocess": PREPROCESS_VERSION,
+                        "people": people}).encode("utf-8")
+    images_at, hist_at, size = _layout(offset, face_size, len(index))
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, face_size, HIST_SIZE, offset, len(index)) + index)
+        f.seek(images_at)
+        for _, _, faces, _, _ in blocks:
+            f.write(np.ascontiguousarray(faces, dtype=np.uint8).tobytes())
+        f.seek(hist_at)
+        for _, _, _, histograms, _ in blocks:
+            f.write(np.ascontiguousarray(histograms, dtype="<f4").tobytes())
+        f.truncate(size)
+    os.replace(tmp_path, path)
+
+
+# =========== READ ===========
+def read_header(path):
+    """Return (header dict, index dict) without touching the arrays"""
+    with open(path, "rb") as f:
+        raw = f.read(HEADER.size)
+        if len(raw) < HEADER.size:
+            raise ValueError(f"{path}: truncated dataset header")
+        magic, version, flags, face_size, hist_size, count, index_len = HEADER.unpack(raw)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a face dataset")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported dataset version {version}")
+        index = json.loads(f.read(index_len).decode("utf-8"))
+    header = {"version": version, "face_size": face_size, "hist_size": hist_size,
+              "count": count, "index_len": index_len}
+    return header, index
+
+
+def load(path=DATASET_PATH, mmap=MMAP_DEFAULT):
+    """Open a .fds file; with mmap=True the arrays stay on disk until used"""
+    header, index = read_header(path)
+    if header["hist_size"] != HIST_SIZE:
+        raise ValueError(f"{path}: histogram size {header['hist_size']} does not match {HIST_SIZE}")
+    face_size = header["face_size"]
+    count = header["count"]
+    images_at, hist_at, size = _layout(count, face_size, header["index_len"])
+    if os.path.getsize(path) < size:
+        raise ValueError(f"{path}: truncated dataset data")
+    if mmap and count:
+        data = np.memmap(path, dtype=np.uint8, mode="r", shape=(size,))
+    else:
+        data = np.fromfile(path, dtype=np.uint8, count=size)
+    images = data[images_at:images_at + count * face_size * face_size].reshape(count, face_size, face_size)
+    histograms = data[hist_at:size].view("<f4").reshape(count, HIST_SIZE)
+    return FaceDataset(images, histograms, index["people"], face_size, index.get("preprocess", 1))
+
+
+# =========== FOLDER IMPORT / EXPORT ===========
+def image_files(person_path):
+    return [file for file in sorted(os.listdir(person_path))
+            if file.lower().endswith(IMAGE_EXTENSIONS)]
+
+
+def _process_file(path, known_hashes):
+    """Hash one image file and, unless that content is already stored, preprocess it.
+
+    Returns (sha1, face, histogram); face is None for known content or an
+    unreadable image.
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+    sha1 = hashlib.sha1(raw).hexdigest()
+    if sha1 in known_hashes:
+        return sha1, None, None
+    img = cv2.imdecode(np.frombuffer(raw, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        return sha1, None, None
+    face = normalize_face(img)
+    return sha1, face, lbp_histogram(face)
+
+
+def sync(face_dir=FACE_DIR, path=DATASET_PATH, progress=None, workers=LOAD_WORKERS):
+    """Make `path` match the enrollment folders and return it loaded.
+
+    Nothing is written when no image changed. Otherwise stored faces are
+    reused by (path, size, mtime) or by content hash, the remaining images
+    are decoded, normalized and turned into LBP histograms by a pool of
+    `workers` threads, and faces whose file is gone are dropped. Unreadable
+    images are recorded and not hashed again until their size or mtime changes.
+    progress(done, total) is called as changed images are processed.
+    """
+    old = empty_dataset()
+    if os.path.exists(path):
+        try:
+            old = load(path)
+        except ValueError as e:
+            print(f"Rebuilding {path}: {e}")
+    if not old.reusable:
+        old = empty_dataset()
+    records = old.file_records()
+    failed_records = old.failed_records()
+    known_hashes = {sha1: row for size, mtime_ns, sha1, row in records.values()}
+
+    names = []
+    if os.path.isdir(face_dir):
+        names = sorted(name for name in os.listdir(face_dir)
+                       if os.path.isdir(os.path.join(face_dir, name)))
+
+    # Per face: [file, size, mtime_ns, sha1, source], where source is a row
+    # of the old file, a freshly computed (face, histogram) pair, or None
+    # while the image still has to be processed. Unchanged unreadable images
+    # go straight to failed as [file, size, mtime_ns]
+    entries = {}
+    failed = {}
+    todo = []
+    for name in names:
+        person_path = os.path.join(face_dir, name)
+        entries[name] = []
+        failed[name] = []
+        for file in image_files(person_path):
+            stat = os.stat(os.path.join(person_path, file))
+            key = (stat.st_size, stat.st_mtime_ns)
+            entry = [file, stat.st_size, stat.st_mtime_ns, None, None]
+            record = records.get((name, file))
+            if record is not None and record[:2] == key:
+                entry[3], entry[4] = record[2], record[3]
+            elif failed_records.get((name, file)) == key:
+                failed[name].append(entry[:3])
+                continue
+            else:
+                todo.append((os.path.join(person_path, file), entry))
+            entries[name].append(entry)
+
+    current = [(name, entry[0]) for name in names for entry in entries[name]]
+    skipped = [(name, entry[0]) for name in names for entry in failed[name]]
+    if not todo and current == list(records) and skipped == list(failed_records):
+        return old
+
+    computed = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        # map() yields in submission order while the images are processed in parallel
+        results = pool.map(lambda item: _process_file(item[0], known_hashes), todo)
+        for done, ((_, entry), (sha1, face, histogram)) in enumerate(zip(todo, results), start=1):
+            entry[3] = sha1
+            if face is not None:
+                entry[4] = (face, histogram)
+                computed += 1
+            elif sha1 in known_hashes:
+                entry[4] = known_hashes[sha1]
+            if progress is not None:
+                progress(done, len(todo))
+
+    blocks = []
+    unreadable = 0
+    for name in names:
+        kept = [entry for entry in entries[name] if entry[4] is not None]
+        for entry in entries[name]:
+            if entry[4] is None:
+                print(f"Skipping unreadable image {os.path.join(face_dir, name, entry[0])}")
+                failed[name].append(entry[:3])
+                unreadable += 1
+        faces = np.zeros((len(kept), FACE_SIZE, FACE_SIZE), np.uint8)
+        histograms = np.zeros((len(kept), HIST_SIZE), np.float32)
+        for i, entry in enumerate(kept):
+            if isinstance(entry[4], tuple):
+                faces[i], histograms[i] = entry[4]
+            else:
+                faces[i], histograms[i] = old.images[entry[4]], old.histograms[entry[4]]
+        blocks.append((name, [entry[:4] for entry in kept], faces, histograms,
+                       sorted(failed[name])))
+    save(path, blocks)
+    evicted = len(set(records) - set(current))
+    del old, blocks  # Release the old map before anyone reads the new file
+    print(f"Face dataset updated: {computed} images processed, "
+          f"{len(current) - computed - unreadable} reused, {unreadable} unreadable, {evicted} removed")
+    return load(path)
+
+
+def export_folders(dataset, face_dir, extension=".png"):
+    """Write a dataset back out as <face_dir>/<name>/face_N.png"""
+    for name in dataset.names():
+        person_dir = os.path.join(face_dir, name)
+        os.makedirs(person_dir, exist_ok=True)
+        for i, face in enumerate(dataset.faces(name), start=1):
+            cv2.imwrite(os.path.join(person_dir, f"face_{i}{extension}"), np.asarray(face))
+
+
+# =========== CLI ===========
+def main():
+    parser = argparse.ArgumentParser(description="Build, export and inspect the packed face dataset")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="Pack the enrollment folders (only new or changed images are decoded)")
+    imp.add_argument("face_dir", nargs="?", default=FACE_DIR)
+    imp.add_argument("-o", "--output", default=DATASET_PATH)
+    exp = sub.add_parser("export", help="Write the dataset as one image folder per person")
+    exp.add_argument("face_dir")
+    exp.add_argument("--dataset", default=DATASET_PATH)
+    info = sub.add_parser("info", help="Show the header and the people in a dataset")
+    info.add_argument("path", nargs="?", default=DATASET_PATH)
+    args = parser.parse_args()
+
+    if args.command == "import":
+        dataset = sync(args.face_dir, args.output)
+        print(f"{args.output}: {len(dataset.names())} people, {len(dataset)} faces, "
+              f"{os.path.getsize(args.output) / 1024:.0f} KiB")
+    elif args.command == "export":
+        dataset = load(args.dataset)
+        export_folders(dataset, args.face_dir)
+        print(f"Wrote {len(dataset)} faces of {len(dataset.names())} people to {args.face_dir}")
+    else:
+        header, index = read_header(args.path)
+        for key, value in header.items():
+            print(f"{key:<12} {value}")
+        print(f"{'created':<12} {index.get('created')}")
+        for person in index["people"]:
+            print(f"  {person['name']:<24} {person['count']:>5} faces")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,14 @@
 # face_recognition_app.py
+import argparse
+import sys
 import streamlit as st
 import cv2
-import numpy as np
-import os
-import sqlite3
-import datetime
-from PIL import Image
 import time
-import paho.mqtt.client as mqtt
 import json
-import base64
 import threading
-# For PC buzzer sound simulation
-import winsound
+from mqtt_bus import get_bus
+from frame_codec import decode_frame, CAMERA_QOS
+from frame_pipeline import draw_faces
 
 st.set_page_config(layout="wide")
 
@@ -37,140 +33,129 @@ if 'is_locked' not in st.session_state:
 if 'emergency_mode' not in st.session_state:
     st.session_state.emergency_mode = False
 
-# Function to simulate buzzer on PC
-def sound_alarm(duration=1000, frequency=800):
-    """Simulate alarm sound on PC"""
-    try:
-        # Windows-specific sound (duration in ms, freq in Hz)
-        winsound.Beep(frequency, duration)
-    except:
-        # Fallback for non-Windows systems
-        print("ALARM SOUND: Cannot play on this system")
+# Recognition boxes are only drawn on frames captured within this many
+# seconds of the result, so boxes don't linger after someone walks away
+MAX_BOX_AGE = 1.0
+# Warn when recognition_service.py has sent nothing for this long
+FEED_TIMEOUT = 5
 
-class MQTTClient:
-    def __init__(self):
-        self.client = mqtt.Client(client_id="WebApp")
-        
-        try:
-            self.client.connect("localhost", 1883)
-            self.client.subscribe([
-                ("smartlock/events", 2),  # Critical events - QoS 2
-                ("smartlock/control", 2),  # Control commands - QoS 2 
-                ("smartlock/admin_action", 2)  # Admin actions - QoS 2
-            ])
-            self.client.on_message = self.on_message
-            print("Connected to MQTT broker")
-        except ConnectionRefusedError:
+def parse_args():
+    """Options after `--`: streamlit run face_recognition_app.py -- --door front"""
+    parser = argparse.ArgumentParser(description="Smart lock viewer")
+    parser.add_argument("--door", help="Door name from multi_camera.py; omit for the single-camera setup")
+    return parser.parse_known_args(sys.argv[1:])[0]
+
+DOOR = parse_args().door
+
+class ViewerFeed:
+    """Read-only view of what recognition_service.py publishes.
+
+    Uses the process-wide MQTT bus and is cached with st.cache_resource, so
+    there is one connection per Streamlit server instead of one per rerun
+    or session. The MQTT thread only keeps
+    the newest message of each kind; sessions pick them up from their own
+    script thread, so st.session_state is never touched from paho's thread.
+
+    With a door it shows that multi_camera.py door (smartlock/<door>/...)
+    and ignores events and admin notices tagged with another door.
+    """
+
+    def __init__(self, door=None):
+        self.door = door
+        self.prefix = f"smartlock/{door}" if door else "smartlock"
+        self.cond = threading.Condition()
+        self.frame_count = 0
+        self.frame_payload = None
+        self.recognition = None
+        self.status = None
+        self.last_access = None
+        # Admin notices as (count, message); sessions remember the count they showed
+        self.notices = {"admin_action": (0, None), "admin_message": (0, None)}
+
+        self.bus = get_bus("WebApp")
+        topics = [
+            (f"{self.prefix}/camera", CAMERA_QOS),  # Camera feed - binary frames
+            (f"{self.prefix}/recognition", 0),  # Per-frame results - QoS 0
+            (f"{self.prefix}/status", 2),  # Door state (retained) - QoS 2
+            ("smartlock/events", 2),  # Critical events - QoS 2
+            (f"{self.prefix}/control", 2),  # Control commands - QoS 2
+            ("smartlock/admin_action", 2)  # Admin actions - QoS 2
+        ]
+        if door:
+            topics.append(("smartlock/control", 2))  # Broadcast commands (lockdown) - QoS 2
+        for topic, qos in topics:
+            self.bus.subscribe(topic, qos, self.on_message)
+        if not self.bus.wait_connected(timeout=2):
             st.error("Failed to connect to MQTT broker. Is the broker running?")
-            print("Failed to connect to MQTT broker. Is Mosquitto running?")
-        
+            print("Failed to connect to MQTT broker. Is Mosquitto running? (retrying in the background)")
+
     def on_message(self, client, userdata, msg):
         try:
+            if msg.topic == f"{self.prefix}/camera":
+                with self.cond:
+                    self.frame_payload = msg.payload
+                    self.frame_count += 1
+                    self.cond.notify_all()
+                return
             data = json.loads(msg.payload)
-            if msg.topic == "smartlock/events":
-                st.session_state.last_access = data
-            elif msg.topic == "smartlock/control":
-                if data["source"] == "admin":
+            if data.get("door") not in (None, self.door):
+                return  # Another door's event or notice
+            with self.cond:
+                if msg.topic == f"{self.prefix}/recognition":
+                    self.recognition = data
+                elif msg.topic == f"{self.prefix}/status":
+                    self.status = data
+                elif msg.topic == "smartlock/events":
+                    self.last_access = data
+                elif (msg.topic == f"{self.prefix}/control" or data.get("command") == "lockdown") \
+                        and data.get("source") == "admin":
+                    # A door only obeys lockdown from the global topic (see recognition_service.py)
                     if data["command"] == "unlock":
-                        st.session_state.admin_message = "✅ Access Allowed by Admin"
-                        st.session_state.is_locked = False
-                        # Reset emergency mode if it was active
-                        st.session_state.emergency_mode = False
+                        self._notify("admin_message", "✅ Access Allowed by Admin")
                     elif data["command"] == "lockdown":
-                        st.session_state.admin_message = "❌ Access Denied by Admin. Contacting emergency services."
-                        st.session_state.is_locked = True
-                        st.session_state.emergency_mode = True
-                        # Sound the alarm
-                        threading.Thread(target=sound_alarm, args=(2000, 1000)).start()
-            elif msg.topic == "smartlock/admin_action":
-                # Handle admin actions from system_logs
-                if data["action"] == "allowed":
-                    st.session_state.admin_action = {
-                        "message": data["message"] if "message" in data else "✅ Access Allowed by Admin",
-                        "timestamp": data["timestamp"]
-                    }
-                    st.session_state.is_locked = False
-                    # Reset emergency mode if it was active
-                    st.session_state.emergency_mode = False
-                elif data["action"] == "denied":
-                    st.session_state.admin_action = {
-                        "message": data["message"] if "message" in data else "❌ Access Denied by Admin",
-                        "timestamp": data["timestamp"]
-                    }
-                    st.session_state.is_locked = True
-                    st.session_state.emergency_mode = True
-                    # Sound the alarm
-                    threading.Thread(target=sound_alarm, args=(2000, 1000)).start()
+                        self._notify("admin_message", "❌ Access Denied by Admin. Contacting emergency services.")
+                elif msg.topic == "smartlock/admin_action":
+                    # Handle admin actions from system_logs
+                    if data["action"] == "allowed":
+                        self._notify("admin_action", data.get("message", "✅ Access Allowed by Admin"))
+                    elif data["action"] == "denied":
+                        self._notify("admin_action", data.get("message", "❌ Access Denied by Admin"))
         except Exception as e:
-            st.error(f"Error processing MQTT message: {str(e)}")
+            print(f"Error processing MQTT message: {e}")
 
-try:
-    mqtt_client = MQTTClient()
-    mqtt_client.client.loop_start()
-except Exception as e:
-    st.error(f"MQTT Error: {str(e)}")
+    def _notify(self, kind, message):
+        count, _ = self.notices[kind]
+        self.notices[kind] = (count + 1, message)
 
-@st.cache_resource
-def load_recognizer():
-    recognizer = cv2.face.LBPHFaceRecognizer_create()
-    label_map = {}
-    if os.path.exists("data/trained_model.yml"):
-        recognizer.read("data/trained_model.yml")
-    if os.path.exists("data/label_mapping.txt"):
-        with open("data/label_mapping.txt", "r") as f:
-            for line in f:
-                name, id = line.strip().split(',')
-                label_map[int(id)] = name
-    face_cascade = cv2.CascadeClassifier(
-        cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-    return recognizer, label_map, face_cascade
+    def wait_frame(self, seen, timeout):
+        """Block until a frame newer than `seen` arrives; returns (count, payload)"""
+        with self.cond:
+            self.cond.wait_for(lambda: self.frame_count != seen, timeout)
+            return self.frame_count, self.frame_payload
 
-recognizer, label_map, face_cascade = load_recognizer()
+    def snapshot(self):
+        with self.cond:
+            return self.recognition, self.status, self.last_access, dict(self.notices)
 
-class FaceRecognition:
-    def __init__(self):
-        self.mqtt_client = mqtt.Client("FaceRecognition")
-        self.mqtt_client.connect("localhost", 1883)
-        
-    def recognize_face(self, face_img, recognized_name, is_recognized):
-        timestamp = datetime.datetime.now().isoformat()
-        if is_recognized:
-            self.mqtt_client.publish("smartlock/access", 
-                json.dumps({
-                    "type": "access",
-                    "authorized": True,
-                    "user": recognized_name,
-                    "timestamp": timestamp
-                }), qos=2  # Critical access events - QoS 2
-            )
-            # Update lock status
-            st.session_state.is_locked = False
-        else:
-            self.mqtt_client.publish("smartlock/access", 
-                json.dumps({
-                    "type": "access",
-                    "authorized": False,
-                    "user": "Unknown",
-                    "timestamp": timestamp
-                }), qos=2  # Failed access attempts - QoS 2
-            )
-            # Keep lock status locked
-            st.session_state.is_locked = True
-        
-    def cleanup(self):
-        self.mqtt_client.disconnect()
+@st.cache_resource
+def get_feed(door):
+    return ViewerFeed(door)
 
-face_recognition = FaceRecognition()
+feed = get_feed(DOOR)
+
+if 'seen_notices' not in st.session_state:
+    # Don't replay notices that arrived before this session started
+    st.session_state.seen_notices = {kind: count for kind, (count, _) in feed.snapshot()[3].items()}
 
 def main():
-    st.title("Smart Lock System")
+    st.title(f"Smart Lock System - {DOOR}" if DOOR else "Smart Lock System")
     col1, col2 = st.columns([2, 1])
     camera_placeholder = col1.empty()
     feedback_placeholder = col2.empty()
     marked_list_placeholder = col2.empty()
 
-    start_button = col2.button("Start Camera")
-    stop_button = col2.button("Stop Camera")
+    start_button = col2.button("Show Camera")
+    stop_button = col2.button("Hide Camera")
 
     if start_button:
         st.session_state.camera_running = True
@@ -184,108 +169,105 @@ def main():
     #     col2.success("🔓 DOOR UNLOCKED")
         
     # Display emergency mode warning if active
+    emergency_placeholder = st.empty()
     if st.session_state.emergency_mode:
-        st.error("⚠️ EMERGENCY MODE ACTIVE - Security has been notified")
+        emergency_placeholder.error("⚠️ EMERGENCY MODE ACTIVE - Security has been notified")
 
+    # Recognition runs in recognition_service.py whether or not this page is
+    # open; the buttons only start and stop viewing its output
     if st.session_state.camera_running:
-        cap = cv2.VideoCapture(0)
-        while st.session_state.camera_running:
-            ret, frame = cap.read()
-            if not ret:
-                st.warning("Unable to access webcam.")
-                break
-
-            # Publish the frame over MQTT for admin_control.py to use
-            try:
-                _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 50])
-                jpg_as_text = base64.b64encode(buffer).decode('utf-8')
-                mqtt_client.client.publish("smartlock/camera", jpg_as_text, qos=1)  # Camera frames - QoS 1
-            except Exception as e:
-                print(f"Error publishing camera frame: {e}")
-
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
-
-            recognized_name = None
-            is_recognized = False
-            for (x, y, w, h) in faces:
-                size = max(w, h)
-                center_x, center_y = x + w//2, y + h//2
-                x_new = max(center_x - size//2, 0)
-                y_new = max(center_y - size//2, 0)
-                x_new = min(x_new, gray.shape[1] - size)
-                y_new = min(y_new, gray.shape[0] - size)
-
-                face_roi = gray[y_new:y_new + size, x_new:x_new + size]
-                try:
-                    label, confidence = recognizer.predict(face_roi)
-                    if confidence < 70 and label in label_map:
-                        recognized_name = label_map[label]
-                        is_recognized = True
-                    else:
-                        recognized_name = "Unknown"
-                except:
-                    recognized_name = "Unknown"
+        render_loop(camera_placeholder, feedback_placeholder, emergency_placeholder, col2)
 
-                cv2.rectangle(rgb_frame, (x_new, y_new), (x_new + size, y_new + size), (0, 255, 0), 2)
-                cv2.putText(rgb_frame, recognized_name, (x_new, y_new - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+def render_loop(camera_placeholder, feedback_placeholder, emergency_placeholder, col2):
+    """Show the service's newest frame with its recognition boxes and update the UI"""
+    seen_frame = 0
+    last_frame_at = time.time()
+    while st.session_state.camera_running:
+        frame_count, payload = feed.wait_frame(seen_frame, timeout=0.5)
+        if frame_count == seen_frame:
+            if time.time() - last_frame_at > FEED_TIMEOUT:
+                camera_placeholder.warning("Waiting for camera feed from recognition_service.py...")
+            continue
+        seen_frame = frame_count
+        last_frame_at = time.time()
+        try:
+            header, frame = decode_frame(payload)
+        except Exception as e:
+            print(f"Error decoding camera frame: {e}")
+            continue
 
-            face_recognition.recognize_face(frame, recognized_name, is_recognized)
+        recognition, door_status, last_access, notices = feed.snapshot()
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        recognized_name = None
+        if recognition and (header is None or abs(header["timestamp"] - recognition["timestamp"]) <= MAX_BOX_AGE):
+            draw_faces(rgb_frame, recognition["boxes"])
+            recognized_name = recognition["name"]
+        camera_placeholder.image(rgb_frame, channels="RGB", use_container_width=True, caption="Live Camera Feed")
 
-            camera_placeholder.image(rgb_frame, channels="RGB", use_container_width=True, caption="Live Camera Feed")
-            
-            # Check for admin actions first
-            if st.session_state.admin_action:
-                feedback_placeholder.empty()  # Clear previous messages
-                if "Allowed" in st.session_state.admin_action["message"]:
-                    feedback_placeholder.success(st.session_state.admin_action["message"])
-                else:
-                    feedback_placeholder.error(st.session_state.admin_action["message"])
-                time.sleep(3)
-                st.session_state.admin_action = None
-            # Then check for face recognition messages
-            elif recognized_name:
-                if recognized_name != "Unknown":
-                    feedback_placeholder.success(f"✅ Welcome, {recognized_name}!")
-                    st.session_state.unknown_timeout_until = None
+        # Door state and admin notices come from the service and system_logs
+        if door_status:
+            st.session_state.is_locked = door_status["locked"]
+            st.session_state.emergency_mode = door_status["emergency"]
+        if st.session_state.emergency_mode:
+            emergency_placeholder.error("⚠️ EMERGENCY MODE ACTIVE - Security has been notified")
+        else:
+            emergency_placeholder.empty()
+        st.session_state.last_access = last_access
+        for kind, (count, message) in notices.items():
+            if count != st.session_state.seen_notices[kind]:
+                st.session_state.seen_notices[kind] = count
+                if kind == "admin_action":
+                    st.session_state.admin_action = {"message": message}
                 else:
-                    current_time = time.time()
-                    if st.session_state.unknown_timeout_until is None:
-                        feedback_placeholder.error("❌ Face not recognized - Contacting admin...")
-                        st.session_state.unknown_timeout_until = current_time + 60  # 60 second timeout
-                    elif current_time < st.session_state.unknown_timeout_until:
-                        # Don't show error during timeout, show waiting message instead
-                        remaining_time = int(st.session_state.unknown_timeout_until - current_time)
-                        feedback_placeholder.warning(f"⏳ Waiting for admin response... ({remaining_time}s)")
-                    else:
-                        # Timeout expired, show error again
-                        feedback_placeholder.error("❌ Face not recognized - Contacting admin...")
-                        st.session_state.unknown_timeout_until = current_time + 60
-
-            # Check for legacy admin message (keeping for compatibility)
-            if st.session_state.admin_message:
-                feedback_placeholder.empty()  # Clear previous messages
-                if "Allowed" in st.session_state.admin_message:
-                    feedback_placeholder.success(st.session_state.admin_message)
+                    st.session_state.admin_message = message
+        
+        # Check for admin actions first
+        if st.session_state.admin_action:
+            feedback_placeholder.empty()  # Clear previous messages
+            if "Allowed" in st.session_state.admin_action["message"]:
+                feedback_placeholder.success(st.session_state.admin_action["message"])
+            else:
+                feedback_placeholder.error(st.session_state.admin_action["message"])
+            time.sleep(3)
+            st.session_state.admin_action = None
+        # Then check for face recognition messages
+        elif recognized_name:
+            if recognized_name != "Unknown":
+                feedback_placeholder.success(f"✅ Welcome, {recognized_name}!")
+                st.session_state.unknown_timeout_until = None
+            else:
+                current_time = time.time()
+                if st.session_state.unknown_timeout_until is None:
+                    feedback_placeholder.error("❌ Face not recognized - Contacting admin...")
+                    st.session_state.unknown_timeout_until = current_time + 60  # 60 second timeout
+                elif current_time < st.session_state.unknown_timeout_until:
+                    # Don't show error during timeout, show waiting message instead
+                    remaining_time = int(st.session_state.unknown_timeout_until - current_time)
+                    feedback_placeholder.warning(f"⏳ Waiting for admin response... ({remaining_time}s)")
                 else:
-                    feedback_placeholder.error(st.session_state.admin_message)
-                time.sleep(3)
-                st.session_state.admin_message = None
+                    # Timeout expired, show error again
+                    feedback_placeholder.error("❌ Face not recognized - Contacting admin...")
+                    st.session_state.unknown_timeout_until = current_time + 60
 
-            if st.session_state.last_access:
-                access = st.session_state.last_access
-                status = "✅ Granted" if access["status"] == "granted" else "❌ Denied"
-                col2.markdown(f"""
-                    **Last Access Attempt**
-                    - Name: {access['name']}
-                    - Status: {status}
-                    - Time: {access['timestamp']}
-                """)
+        # Check for legacy admin message (keeping for compatibility)
+        if st.session_state.admin_message:
+            feedback_placeholder.empty()  # Clear previous messages
+            if "Allowed" in st.session_state.admin_message:
+                feedback_placeholder.success(st.session_state.admin_message)
+            else:
+                feedback_placeholder.error(st.session_state.admin_message)
+            time.sleep(3)
+            st.session_state.admin_message = None
 
-            time.sleep(0.03)
-        cap.release()
-        face_recognition.cleanup()
+        if st.session_state.last_access:
+            access = st.session_state.last_access
+            status = "✅ Granted" if access["status"] == "granted" else "❌ Denied"
+            col2.markdown(f"""
+                **Last Access Attempt**
+                - Name: {access['name']}
+                - Status: {status}
+                - Time: {access['timestamp']}
+            """)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
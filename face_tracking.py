@@ -0,0 +1,123 @@
+# face_tracking.py
+import time
+import cv2
+from frame_pipeline import DETECT_PARAMS, CascadeDetector, create_face_cascade
+
+
+def make_detector_factory(mode, workers, detect_every=5, scale=0.5):
+    """Return (detector_factory, workers) for a FramePipeline.
+
+    mode "full" detects on every full-resolution frame with `workers`
+    parallel workers; "tracking" uses a TrackingDetector, whose tracks carry
+    state between frames, so it always runs a single worker.
+    """
+    if mode == "tracking":
+        return (lambda: TrackingDetector(detect_every=detect_every, scale=scale)), 1
+    return CascadeDetector, workers
+
+
+class TrackingDetector:
+    """Downscaled Haar detection every N frames with template tracking in between.
+
+    The cascade runs on a frame shrunk by `scale` once every `detect_every`
+    frames. On the frames in between each face is followed by normalized
+    template matching inside a small search window around its last position,
+    which costs a fraction of a cascade pass. If any track loses its face the
+    next frame falls back to a fresh detection, and so does the first frame
+    after reset() (the pipeline calls it when the scene may have changed
+    unseen, e.g. on a motion gate wakeup). Boxes are always returned in
+    full-resolution coordinates, so the LBPH crop is taken from the original
+    gray frame.
+
+    Not thread-safe: the tracks carry state from frame to frame, so give each
+    pipeline worker its own instance (and preferably run a single worker).
+    """
+
+    def __init__(self, face_cascade=None, detect_every=5, scale=0.5,
+                 search_margin=0.5, min_match=0.6, params=None):
+        self.face_cascade = face_cascade if face_cascade is not None else create_face_cascade()
+        self.detect_every = max(1, int(detect_every))
+        self.scale = scale
+        self.search_margin = search_margin
+        self.min_match = min_match
+
+        params = params or DETECT_PARAMS
+        side = max(1, int(round(params["minSize"][0] * scale)))
+        self.detect_params = dict(params, minSize=(side, side))
+
+        self.tracks = []  # [(x, y, w, h, template)] in downscaled coordinates
+        self.frame_index = 0
+
+        # Counters for measuring the speedup against full-resolution detection
+        self.detections = 0
+        self.tracked_frames = 0
+        self.detect_time = 0.0
+        self.track_time = 0.0
+
+    def detect(self, gray):
+        small = cv2.resize(gray, None, fx=self.scale, fy=self.scale,
+                           interpolation=cv2.INTER_AREA)
+
+        faces = None
+        if self.frame_index % self.detect_every != 0:
+            start = time.perf_counter()
+            faces = self._track(small)
+            self.track_time += time.perf_counter() - start
+            if faces is not None:
+                self.tracked_frames += 1
+        if faces is None:
+            start = time.perf_counter()
+            faces = self._detect(small)
+            self.detect_time += time.perf_counter() - start
+            self.detections += 1
+            # Restart the cadence so the next N-1 frames are tracked
+            self.frame_index = 0
+        self.frame_index += 1
+
+        # Map boxes back to full resolution
+        return [(int(round(x / self.scale)), int(round(y / self.scale)),
+                 int(round(w / self.scale)), int(round(h / self.scale)))
+                for (x, y, w, h) in faces]
+
+    def reset(self):
+        """Drop the tracks so the next frame runs the cascade"""
+        self.tracks = []
+        self.frame_index = 0
+
+    def stats(self):
+        """Average cost per detected and per tracked frame, in milliseconds"""
+        return {
+            "detections": self.detections,
+            "tracked_frames": self.tracked_frames,
+            "avg_detect_ms": 1000 * self.detect_time / max(1, self.detections),
+            "avg_track_ms": 1000 * self.track_time / max(1, self.tracked_frames),
+        }
+
+    def _detect(self, small):
+        faces = self.face_cascade.detectMultiScale(small, **self.detect_params)
+        self.tracks = [(x, y, w, h, small[y:y + h, x:x + w].copy())
+                       for (x, y, w, h) in faces]
+        return [(x, y, w, h) for (x, y, w, h, _) in self.tracks]
+
+    def _track(self, small):
+        """Follow every track; returns None if any face was lost"""
+        updated = []
+        for (x, y, w, h, template) in self.tracks:
+            margin_x = int(w * self.search_margin)
+            margin_y = int(h * self.search_margin)
+            x0, y0 = max(x - margin_x, 0), max(y - margin_y, 0)
+            x1 = min(x + w + margin_x, small.shape[1])
+            y1 = min(y + h + margin_y, small.shape[0])
+            window = small[y0:y1, x0:x1]
+            if window.shape[0] < h or window.shape[1] < w:
+                return None
+
+            scores = cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED)
+            _, best, _, (dx, dy) = cv2.minMaxLoc(scores)
+            if best < self.min_match:
+                return None
+
+            nx, ny = x0 + dx, y0 + dy
+            updated.append((nx, ny, w, h, small[ny:ny + h, nx:nx + w].copy()))
+        self.tracks = updated
+        return [(x, y, w, h) for (x, y, w, h, _) in updated]
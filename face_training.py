@@ -0,0 +1,315 @@
+# face_training.py
+import datetime
+import os
+import threading
+import cv2
+import numpy as np
+import lbp_gallery
+from lbp_gallery import LBPGallery, HIST_SIZE
+import face_dataset
+from face_dataset import FACE_DIR, DATASET_PATH, IMAGE_EXTENSIONS
+import model_store
+import compaction
+
+# ==================================================================
+# Index:
+#   - PATHS
+#   - LABEL MAPPING
+#   - FACE DATASET
+#   - FULL RETRAIN
+#   - MODEL FILES
+#   - BINARY GALLERY
+#   - BACKGROUND TRAINING
+#   - LOAD FOR RECOGNITION
+# ==================================================================
+
+# =========== PATHS ===========
+MODEL_PATH = "data/trained_model.yml"
+LABEL_MAP_PATH = "data/label_mapping.txt"
+# k-means prototypes kept of each person's histograms (see compaction.py)
+# when the current model has no count recorded; 0 keeps every sample.
+# `compaction.py --write` records its count with the model and later
+# retrains keep it
+PROTOTYPES_PER_USER = 0
+# Settings recorded with the model (YAML keys and .lbpg metadata)
+SETTINGS_KEYS = ("preprocess", "prototypes")
+
+
+# =========== LABEL MAPPING ===========
+def load_label_ids(path=LABEL_MAP_PATH):
+    """Read label_mapping.txt into {name: id}"""
+    label_ids = {}
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                name, id = line.rsplit(',', 1)
+                label_ids[name] = int(id)
+    return label_ids
+
+
+def load_label_map(path=LABEL_MAP_PATH):
+    """Read label_mapping.txt into {id: name} as used for recognition"""
+    return {id: name for name, id in load_label_ids(path).items()}
+
+
+def save_label_ids(label_ids, path=LABEL_MAP_PATH):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        for name, id in sorted(label_ids.items(), key=lambda item: item[1]):
+            f.write(f"{name},{id}\n")
+    os.replace(tmp_path, path)
+
+
+def next_label_id(label_ids):
+    return max(label_ids.values()) + 1 if label_ids else 0
+
+
+# =========== FACE DATASET ===========
+def load_dataset(face_dir=FACE_DIR, dataset_path=DATASET_PATH, progress=None):
+    """Packed face crops and LBP histograms of every enrolled person.
+
+    face_dataset.py caches them by file and content hash, so only images
+    that are new or changed since the last call are decoded (in parallel);
+    progress(done, total) follows that work.
+    """
+    return face_dataset.sync(face_dir, dataset_path, progress)
+
+
+# =========== FULL RETRAIN ===========
+def train_full(face_dir=FACE_DIR, model_path=MODEL_PATH, label_path=LABEL_MAP_PATH,
+               dataset_path=DATASET_PATH, progress=None, prototypes=None):
+    """Rebuild the model from every enrolled person.
+
+    The model is assembled from the cached histograms instead of running
+    LBPH train(), so a retrain only costs the images that changed.
+    With `prototypes` set, each person's histograms are compacted to that
+    many k-means prototypes (0 keeps all); by default the count recorded
+    with the current model is kept. Label ids of people that are still enrolled
+    are kept, new people get fresh ids and removed people are dropped from
+    the mapping. Returns the {name: id} mapping, or None if there was
+    nothing to train.
+    """
+    old_ids = load_label_ids(label_path)
+    dataset = load_dataset(face_dir, dataset_path, progress)
+    people = [name for name in dataset.names() if len(dataset.faces(name))]
+    label_ids = {name: old_ids[name] for name in people if name in old_ids}
+
+    for name in people:
+        if name not in label_ids:
+            label_ids[name] = next_label_id(label_ids)
+    if not people:
+        return None
+
+    if prototypes is None:
+        prototypes = model_settings(model_path).get("prototypes")
+        if prototypes is None:
+            prototypes = PROTOTYPES_PER_USER
+    gallery = compaction.build_gallery(
+        [(label_ids[name], dataset.person_histograms(name)) for name in people], prototypes)
+    if prototypes:
+        print(f"Compacted {len(dataset)} samples to {len(gallery)} prototypes")
+    save_model(gallery, model_path, prototypes)
+    save_gallery(gallery, model_path, prototypes)
+    save_label_ids(label_ids, label_path)
+    return label_ids
+
+
+# =========== MODEL FILES ===========
+def save_model(gallery, model_path=MODEL_PATH, prototypes=0):
+    """Write a gallery as an OpenCV LBPH YAML model, atomically.
+
+    Same layout as LBPHFaceRecognizer.save() (lbp_gallery computes the same
+    histograms), so the opencv backend and older tools read it unchanged.
+    Top-level keys after the model record the training settings (face
+    preprocessing version, prototypes per person); OpenCV ignores them.
+    Written to a temp file first, so a service reloading it never sees
+    half a file.
+    """
+    root, ext = os.path.splitext(model_path)
+    tmp_path = f"{root}.tmp{ext}"  # FileStorage picks the format from the extension
+    fs = cv2.FileStorage(tmp_path, cv2.FILE_STORAGE_WRITE)
+    fs.startWriteStruct("opencv_lbphfaces", cv2.FileNode_MAP)
+    fs.write("threshold", float(min(gallery.threshold, np.finfo(np.float64).max)))
+    fs.write("radius", lbp_gallery.RADIUS)
+    fs.write("neighbors", lbp_gallery.NEIGHBORS)
+    fs.write("grid_x", lbp_gallery.GRID_X)
+    fs.write("grid_y", lbp_gallery.GRID_Y)
+    fs.startWriteStruct("histograms", cv2.FileNode_SEQ)
+    for histogram in gallery.histograms:
+        fs.write("", np.ascontiguousarray(histogram).reshape(1, -1))
+    fs.endWriteStruct()
+    fs.write("labels", gallery.labels.reshape(-1, 1))
+    fs.startWriteStruct("labelsInfo", cv2.FileNode_SEQ)
+    fs.endWriteStruct()
+    fs.endWriteStruct()
+    for key, value in current_settings(prototypes).items():
+        fs.write(key, value)
+    fs.release()
+    os.replace(tmp_path, model_path)
+
+
+def current_settings(prototypes=0):
+    """Settings of a model trained now"""
+    return {"preprocess": face_dataset.PREPROCESS_VERSION, "prototypes": int(prototypes)}
+
+
+def read_settings(model_path=MODEL_PATH):
+    """Training settings stored in a YAML model; None for keys older models lack"""
+    fs = cv2.FileStorage(model_path, cv2.FILE_STORAGE_READ)
+    settings = {}
+    for key in SETTINGS_KEYS:
+        node = fs.getNode(key)
+        settings[key] = None if node.empty() else int(node.real())
+    fs.release()
+    return settings
+
+
+def model_settings(model_path=MODEL_PATH):
+    """Training settings of the model on disk ({} when nothing is trained).
+
+    Read from the .lbpg metadata when that file is current, so only a
+    model without one has its YAML parsed.
+    """
+    gallery_path = model_store.gallery_path_for(model_path)
+    if model_store.is_current(gallery_path, model_path):
+        try:
+            _, metadata = model_store.read_header(gallery_path)
+            return {key: metadata.get(key) for key in SETTINGS_KEYS}
+        except ValueError:
+            pass
+    if not os.path.exists(model_path):
+        return {}
+    return read_settings(model_path)
+
+
+# =========== BINARY GALLERY ===========
+def save_gallery(gallery, model_path=MODEL_PATH, prototypes=0):
+    """Write the .lbpg copy of a just-saved model (see model_store.py)"""
+    model_store.save(gallery, model_store.gallery_path_for(model_path), source=model_path,
+                     settings=current_settings(prototypes))
+
+
+def export_gallery(model_path=MODEL_PATH, gallery_path=None):
+    """Parse the YAML model once and write it as an .lbpg gallery"""
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    recognizer.read(model_path)
+    gallery = LBPGallery.from_recognizer(recognizer)
+    model_store.save(gallery, gallery_path or model_store.gallery_path_for(model_path), source=model_path,
+                     settings=read_settings(model_path))
+    return gallery
+
+
+def empty_gallery():
+    """Gallery that recognizes no one (nothing trained yet)"""
+    return LBPGallery(np.zeros((0, HIST_SIZE), np.float32), [])
+
+
+def load_gallery(model_path=MODEL_PATH):
+    """NumPy gallery for recognition, memory-mapped from the .lbpg file.
+
+    The YAML model is only parsed when the binary file is missing or older
+    than it (e.g. a model trained before this format existed); the binary
+    file is rewritten then, so the next start is fast again.
+    """
+    gallery_path = model_store.gallery_path_for(model_path)
+    if model_store.is_current(gallery_path, model_path):
+        try:
+            return model_store.load(gallery_path)
+        except ValueError as e:
+            print(f"Ignoring {gallery_path}: {e}")
+    if not os.path.exists(model_path):
+        return empty_gallery()
+    print(f"Converting {model_path} to {gallery_path}...")
+    return export_gallery(model_path, gallery_path)
+
+
+def model_version(model_path=MODEL_PATH):
+    """Identifies the model on disk (its mtime); None when nothing is trained"""
+    try:
+        return str(os.stat(model_path).st_mtime_ns)
+    except FileNotFoundError:
+        return None
+
+
+def model_event(model_path=MODEL_PATH, label_path=LABEL_MAP_PATH):
+    """Retained smartlock/model payload that makes running services reload"""
+    return {
+        "type": "model",
+        "version": model_version(model_path),
+        "users": len(load_label_ids(label_path)),
+        "timestamp": datetime.datetime.now().isoformat(),
+    }
+
+
+# =========== BACKGROUND TRAINING ===========
+class TrainingJob:
+    """Runs train_full() on a worker thread.
+
+    The UI polls `done` and `progress` (images decoded, images to decode);
+    `result` is train_full()'s {name: id} mapping and `error` any exception.
+    """
+
+    def __init__(self, **paths):
+        self.paths = paths
+        self.progress = (0, 0)
+        self.result = None
+        self.error = None
+        self.done = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _on_progress(self, done, total):
+        self.progress = (done, total)
+
+    def _run(self):
+        try:
+            self.result = train_full(progress=self._on_progress, **self.paths)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+
+
+# =========== LOAD FOR RECOGNITION ===========
+def check_preprocess(model_path=MODEL_PATH):
+    """Refuse a model that does not match how recognition normalizes faces.
+
+    Histograms of differently preprocessed faces are far apart, so a model
+    trained with other (or unrecorded, i.e. older) preprocessing would
+    deny everyone. Raises ValueError for such a model. It is not retrained
+    here: every recognition process would do it at once, so retraining is
+    left to `model_store.py retrain` and register_faces.py.
+    """
+    gallery_path = model_store.gallery_path_for(model_path)
+    if not os.path.exists(model_path) and not os.path.exists(gallery_path):
+        return
+    found = model_settings(model_path).get("preprocess")
+    if found == face_dataset.PREPROCESS_VERSION:
+        return
+    trained = f"with face preprocessing v{found}" if found is not None else "before face preprocessing was versioned"
+    problem = f"{model_path} was trained {trained}, but recognition uses v{face_dataset.PREPROCESS_VERSION}"
+    raise ValueError(f"{problem}. Retrain it with `python model_store.py retrain` "
+                     f"or by enrolling someone in register_faces.py.")
+
+
+def load_recognizer(backend="opencv", model_path=MODEL_PATH, label_path=LABEL_MAP_PATH):
+    """Load the trained model and label map for recognition.
+
+    backend "opencv" returns the LBPHFaceRecognizer itself, "numpy" an
+    LBPGallery (memory-mapped from the binary .lbpg file) that matches all
+    faces of a frame at once. Raises ValueError for a model trained with
+    other face preprocessing (see check_preprocess()).
+    """
+    check_preprocess(model_path)
+    if backend == "numpy":
+        return load_gallery(model_path), load_label_map(label_path)
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    if os.path.exists(model_path):
+        recognizer.read(model_path)
+    return recognizer, load_label_map(label_path)
@@ -0,0 +1,149 @@
+# frame_codec.py
+import base64
+import collections
+import struct
+import time
+import cv2
+import numpy as np
+
+# ==================================================================
+# Binary camera frame format published on smartlock/camera:
+#
+#   magic    2s  b"SL"
+#   version  B   FRAME_VERSION
+#   codec    B   CODEC_JPEG
+#   quality  B   JPEG quality used for this frame
+#   seq      I   frame sequence number
+#   ts       d   capture timestamp (time.time())
+#   width    H   frame width in pixels
+#   height   H   frame height in pixels
+#
+# followed directly by the encoded image bytes. Everything is network
+# byte order, so the header is a fixed 21 bytes.
+# ==================================================================
+
+FRAME_MAGIC = b"SL"
+FRAME_VERSION = 1
+CODEC_JPEG = 1
+HEADER = struct.Struct("!2sBBBIdHH")
+# Camera frames are best-effort; QoS 0 avoids redelivering stale frames
+CAMERA_QOS = 0
+
+
+def encode_frame(frame, seq, captured_at, quality=50):
+    """JPEG-encode a BGR frame and prepend the binary frame header"""
+    ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not ok:
+        raise ValueError("JPEG encoding failed")
+    height, width = frame.shape[:2]
+    header = HEADER.pack(FRAME_MAGIC, FRAME_VERSION, CODEC_JPEG, int(quality),
+                         seq & 0xFFFFFFFF, captured_at, width, height)
+    return header + buffer.tobytes()
+
+
+def decode_header(payload):
+    """Parse the frame header; returns (header dict, image bytes view)"""
+    if len(payload) < HEADER.size or payload[:2] != FRAME_MAGIC:
+        raise ValueError("Not a binary camera frame")
+    magic, version, codec, quality, seq, ts, width, height = HEADER.unpack_from(payload)
+    if version != FRAME_VERSION:
+        raise ValueError(f"Unsupported frame version {version}")
+    header = {
+        "version": version,
+        "codec": codec,
+        "quality": quality,
+        "seq": seq,
+        "timestamp": ts,
+        "width": width,
+        "height": height,
+    }
+    return header, memoryview(payload)[HEADER.size:]
+
+
+def decode_frame(payload):
+    """Decode a camera payload into (header dict, BGR frame).
+
+    Falls back to the old base64 text frames so an older
+    face_recognition_app.py can still feed the admin panel.
+    """
+    try:
+        header, data = decode_header(payload)
+    except ValueError:
+        header, data = None, base64.b64decode(payload)
+    np_arr = np.frombuffer(data, np.uint8)
+    frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+    if frame is None:
+        raise ValueError("Could not decode camera frame")
+    return header, frame
+
+
+class AdaptiveStreamController:
+    """Adapts JPEG quality and frame rate to the measured publish backlog.
+
+    Every published frame's MQTTMessageInfo is tracked until the client has
+    written it to the socket. A growing backlog means the broker link cannot
+    keep up, so quality and frame rate are stepped down; once the backlog has
+    drained they are stepped back up towards the configured maximum.
+
+    While `idle` is set (nothing moving in front of the camera) the frame
+    rate is capped at idle_fps, if one is given.
+    """
+
+    def __init__(self, max_quality=50, min_quality=20, quality_step=5,
+                 max_fps=30, min_fps=5, high_backlog=3, idle_fps=None):
+        self.max_quality = max_quality
+        self.min_quality = min_quality
+        self.quality_step = quality_step
+        self.max_fps = max_fps
+        self.min_fps = min_fps
+        self.high_backlog = high_backlog
+        self.idle_fps = idle_fps
+        self.idle = False
+
+        self.quality = max_quality
+        self.fps = max_fps
+        self.in_flight = collections.deque()
+        self.last_sent = 0
+        self.skipped = 0
+
+    @property
+    def backlog(self):
+        """Number of published frames not yet written out by the client"""
+        while self.in_flight and self._is_published(self.in_flight[0]):
+            self.in_flight.popleft()
+        return len(self.in_flight)
+
+    def should_send(self, now=None):
+        """Rate-limit to the current target fps, adapting on each call"""
+        now = time.time() if now is None else now
+        self._adapt()
+        fps = self.fps
+        if self.idle and self.idle_fps:
+            fps = min(fps, self.idle_fps)
+        if now - self.last_sent < 1.0 / fps:
+            self.skipped += 1
+            return False
+        self.last_sent = now
+        return True
+
+    def track(self, info):
+        """Remember the MQTTMessageInfo returned by client.publish()"""
+        if info is not None:
+            self.in_flight.append(info)
+
+    def _adapt(self):
+        backlog = self.backlog
+        if backlog >= self.high_backlog:
+            self.quality = max(self.min_quality, self.quality - self.quality_step)
+            self.fps = max(self.min_fps, self.fps * 0.8)
+        elif backlog == 0:
+            self.quality = min(self.max_quality, self.quality + 1)
+            self.fps = min(self.max_fps, self.fps + 1)
+
+    @staticmethod
+    def _is_published(info):
+        try:
+            return info.is_published()
+        except Exception:
+            # Raised when the publish already failed (e.g. not connected)
+            return True
@@ -0,0 +1,425 @@
+# frame_pipeline.py
+import collections
+import threading
+import time
+import cv2
+from frame_codec import encode_frame, AdaptiveStreamController
+from face_dataset import normalize_face
+from metrics import Metrics
+
+# ==================================================================
+# Index:
+#   - FACE DETECTION HELPERS
+#   - LATEST-FRAME-WINS QUEUE
+#   - FRAME RING BUFFER
+#   - FRAME RESULT
+#   - FRAME PIPELINE
+# ==================================================================
+
+# Same cascade parameters used everywhere in the project
+DETECT_PARAMS = {"scaleFactor": 1.1, "minNeighbors": 5, "minSize": (30, 30)}
+CONFIDENCE_THRESHOLD = 70
+
+
+# =========== FACE DETECTION HELPERS ===========
+def create_face_cascade():
+    """Load the Haar cascade used for face detection"""
+    return cv2.CascadeClassifier(
+        cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+
+class CascadeDetector:
+    """Full-resolution Haar detection on every frame (the original behaviour)"""
+
+    def __init__(self, face_cascade=None, params=None):
+        self.face_cascade = face_cascade if face_cascade is not None else create_face_cascade()
+        self.params = params or DETECT_PARAMS
+
+    def detect(self, gray):
+        return self.face_cascade.detectMultiScale(gray, **self.params)
+
+    def reset(self):
+        """Nothing carries over between frames"""
+
+
+def square_crop_box(x, y, w, h, frame_shape):
+    """Expand a detection box to a square that stays inside the frame"""
+    size = max(w, h)
+    center_x, center_y = x + w//2, y + h//2
+    x_new = max(center_x - size//2, 0)
+    y_new = max(center_y - size//2, 0)
+    x_new = min(x_new, frame_shape[1] - size)
+    y_new = min(y_new, frame_shape[0] - size)
+    return x_new, y_new, size
+
+
+def recognize_faces(gray, faces, recognizer, label_map):
+    """Square-crop every detected face and run it through the recognizer.
+
+    Crops are resized to face_dataset.FACE_SIZE, the size the model is
+    trained on. Recognizers that offer predict_batch() (lbp_gallery.LBPGallery)
+    score all faces of the frame in one call; otherwise predict() runs per face.
+    Returns the list of (x, y, size, name) boxes plus the overall
+    recognized_name / is_recognized pair used by the access logic: the
+    best-matching known face if there is one (so an unknown face next to a
+    known user never turns a granted vote into "Unknown"), else "Unknown"
+    if any face was seen, else None.
+    """
+    crops = []
+    rois = []
+    for (x, y, w, h) in faces:
+        x_new, y_new, size = square_crop_box(x, y, w, h, gray.shape)
+        crops.append((x_new, y_new, size))
+        rois.append(normalize_face(gray[y_new:y_new + size, x_new:x_new + size]))
+
+    predictions = [None] * len(rois)
+    if rois and hasattr(recognizer, "predict_batch"):
+        try:
+            predictions = recognizer.predict_batch(rois)
+        except Exception:
+            pass
+    elif rois:
+        for i, face_roi in enumerate(rois):
+            try:
+                predictions[i] = recognizer.predict(face_roi)
+            except Exception:
+                pass
+
+    boxes = []
+    recognized_name = "Unknown" if crops else None
+    best_confidence = None
+    for (x_new, y_new, size), prediction in zip(crops, predictions):
+        name = "Unknown"
+        if prediction is not None:
+            label, confidence = prediction
+            if confidence < CONFIDENCE_THRESHOLD and label in label_map:
+                name = label_map[label]
+                if best_confidence is None or confidence < best_confidence:
+                    recognized_name, best_confidence = name, confidence
+        boxes.append((x_new, y_new, size, name))
+    return boxes, recognized_name, best_confidence is not None
+
+
+def draw_faces(rgb_frame, boxes):
+    """Draw the recognition boxes and names onto an RGB frame"""
+    for (x, y, size, name) in boxes:
+        cv2.rectangle(rgb_frame, (x, y), (x + size, y + size), (0, 255, 0), 2)
+        cv2.putText(rgb_frame, name, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+
+
+# =========== LATEST-FRAME-WINS QUEUE ===========
+class LatestQueue:
+    """Bounded queue that drops the oldest item when full, so consumers
+    always get the newest frame and a slow stage never blocks its producer"""
+
+    def __init__(self, maxsize=1):
+        self.maxsize = maxsize
+        self.items = collections.deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self.cond:
+            if self.closed:
+                return
+            if len(self.items) >= self.maxsize:
+                self.items.popleft()
+                self.dropped += 1
+            self.items.append(item)
+            self.cond.notify()
+
+    def get(self, timeout=None):
+        """Return the oldest queued item, or None on timeout/close"""
+        with self.cond:
+            self.cond.wait_for(lambda: self.items or self.closed, timeout)
+            if not self.items:
+                return None
+            return self.items.popleft()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def __len__(self):
+        with self.cond:
+            return len(self.items)
+
+
+# =========== FRAME RING BUFFER ===========
+class FrameRing:
+    """The last few camera frames, numbered by sequence.
+
+    Unlike LatestQueue, reading does not consume: a preview can show the
+    newest frame while a worker walks through the frames it hasn't seen yet.
+    The oldest frame is overwritten when the ring is full.
+    """
+
+    def __init__(self, size=4):
+        self.frames = collections.deque(maxlen=size)
+        self.cond = threading.Condition()
+        self.seq = 0
+
+    def put(self, frame):
+        with self.cond:
+            self.seq += 1
+            self.frames.append((self.seq, frame))
+            self.cond.notify_all()
+            return self.seq
+
+    def latest(self):
+        """(seq, frame) of the newest frame, or (0, None) before the first"""
+        with self.cond:
+            return self.frames[-1] if self.frames else (0, None)
+
+    def next_after(self, seq, timeout=None, newest=False):
+        """Wait for a frame newer than `seq`; returns (seq, frame) or (seq, None) on timeout.
+
+        By default this is the oldest such frame still in the ring, so a
+        reader that falls briefly behind loses nothing; newest=True skips
+        straight to the most recent one.
+        """
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.seq > seq, timeout):
+                return seq, None
+            if newest:
+                return self.frames[-1]
+            for item in self.frames:
+                if item[0] > seq:
+                    return item
+
+
+# =========== FRAME RESULT ===========
+class FrameResult:
+    """Output of the detect/recognize stage for one captured frame"""
+
+    def __init__(self, seq, captured_at, frame, rgb_frame, boxes, recognized_name, is_recognized):
+        self.seq = seq
+        self.captured_at = captured_at
+        self.frame = frame
+        self.rgb_frame = rgb_frame
+        self.boxes = boxes
+        self.recognized_name = recognized_name
+        self.is_recognized = is_recognized
+
+    @property
+    def latency(self):
+        """Seconds from capture until now"""
+        return time.time() - self.captured_at
+
+
+# =========== FRAME PIPELINE ===========
+class FramePipeline:
+    """Staged capture -> (encode/publish, detect/recognize) -> render pipeline.
+
+    A capture thread reads the camera as fast as it delivers frames and hands
+    each one to the publish stage and to a pool of detection workers through
+    LatestQueues. Finished results land in a result queue that the render
+    stage (the Streamlit script) pulls with get_result(). Every queue drops
+    stale frames instead of blocking, so latency stays bounded under load.
+
+    With a motion_gate.MotionGate, frames of a static scene skip detection
+    (and, with the stream controller's idle_fps, most of the publishing);
+    the first frame with motion goes through again. A
+    capture_scheduler.CaptureScheduler additionally switches the camera
+    between idle and active profiles and paces reads to what the detection
+    workers can process.
+    """
+
+    def __init__(self, cap, recognizer, label_map, publish_frame=None,
+                 detector_factory=CascadeDetector, workers=2, queue_size=1,
+                 stream_controller=None, metrics=None, motion_gate=None, capture_scheduler=None):
+        self.cap = cap
+        # (recognizer, label_map) as one tuple so swap_model() is atomic
+        self.model = (recognizer, label_map)
+        self.publish_frame = publish_frame
+        self.detector_factory = detector_factory
+        self.workers = workers
+        self.stream = stream_controller or AdaptiveStreamController()
+        self.metrics = metrics or Metrics(enabled=False)
+        self.motion_gate = motion_gate
+        self.scheduler = capture_scheduler
+
+        self.publish_queue = LatestQueue(queue_size)
+        self.detect_queue = LatestQueue(queue_size)
+        self.result_queue = LatestQueue(queue_size)
+
+        self.running = False
+        self.capture_failed = False
+        self.threads = []
+        self.seq = 0
+        self.last_result_seq = 0
+        self.result_lock = threading.Lock()
+        # First frame of a new scene (gate wakeup, camera profile switch);
+        # workers reset their detector's state from earlier frames there
+        self.detector_reset_seq = 0
+        self._register_gauges()
+
+    def start(self):
+        if self.scheduler is not None:
+            self.scheduler.start(self.cap)
+        self.running = True
+        self.threads = [threading.Thread(target=self._capture_loop, daemon=True)]
+        if self.publish_frame is not None:
+            self.threads.append(threading.Thread(target=self._publish_loop, daemon=True))
+        for _ in range(self.workers):
+            self.threads.append(threading.Thread(target=self._detect_loop, daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.running = False
+        for q in (self.publish_queue, self.detect_queue, self.result_queue):
+            q.close()
+        for thread in self.threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=1)
+        self.threads = []
+
+    def swap_model(self, recognizer, label_map):
+        """Switch to a new model; frames already in a worker finish on the old one"""
+        self.model = (recognizer, label_map)
+
+    def get_result(self, timeout=None):
+        """Return the newest finished FrameResult, or None on timeout"""
+        return self.result_queue.get(timeout)
+
+    @property
+    def dropped_frames(self):
+        return {
+            "publish": self.publish_queue.dropped,
+            "detect": self.detect_queue.dropped,
+            "render": self.result_queue.dropped,
+        }
+
+    def _register_gauges(self):
+        # Read only when a snapshot is taken, never on the frame path
+        queues = {"publish": self.publish_queue, "detect": self.detect_queue, "render": self.result_queue}
+        for name, q in queues.items():
+            self.metrics.gauge(f"{name}_queue_depth", lambda q=q: len(q.items))
+            self.metrics.gauge(f"{name}_dropped_frames", lambda q=q: q.dropped)
+        self.metrics.gauge("publish_backlog", lambda: len(self.stream.in_flight))
+        self.metrics.gauge("publish_skipped_frames", lambda: self.stream.skipped)
+        self.metrics.gauge("stream_quality", lambda: self.stream.quality)
+        self.metrics.gauge("stream_fps", lambda: self.stream.fps)
+        if self.motion_gate is not None:
+            gate = self.motion_gate
+            self.metrics.gauge("motion_active", lambda: int(gate.active))
+            self.metrics.gauge("motion_skipped_frames", lambda: gate.skipped)
+            self.metrics.gauge("motion_wakeups", lambda: gate.wakeups)
+        if self.scheduler is not None:
+            scheduler = self.scheduler
+            self.metrics.gauge("capture_active", lambda: int(scheduler.profile is scheduler.active))
+            self.metrics.gauge("capture_target_fps", scheduler.target_fps)
+            self.metrics.gauge("capture_profile_switches", lambda: scheduler.switches)
+
+    # ---- Stage 1: capture ----
+    def _capture_loop(self):
+        while self.running:
+            if self.scheduler is not None:
+                self.scheduler.wait()
+            with self.metrics.time("capture"):
+                ret, frame = self.cap.read()
+            if not ret or frame is None:
+                print("Capture stage: unable to read frame from camera")
+                self.capture_failed = True
+                self.result_queue.close()
+                break
+
+            self.seq += 1
+            self.metrics.inc("frames_captured")
+            item = (self.seq, time.time(), frame)
+            active = True
+            if self.motion_gate is not None:
+                was_active = self.motion_gate.active
+                with self.metrics.time("motion"):
+                    active = self.motion_gate.check(frame, item[1])
+                self.stream.idle = not active
+                if active and not was_active:
+                    self.detector_reset_seq = self.seq
+            if self.scheduler is not None:
+                # Without a gate only faces (noted by the workers) count as activity
+                changed = self.scheduler.update(self.cap, self.motion_gate is not None and active, item[1])
+                if changed:
+                    self.detector_reset_seq = self.seq + 1
+                    if self.motion_gate is not None:
+                        self.motion_gate.reset()
+            if self.publish_frame is not None:
+                self.publish_queue.put(item)
+            if active:
+                self.detect_queue.put(item)
+            else:
+                # Static scene: nothing new to detect
+                self.metrics.inc("frames_gated")
+
+    # ---- Stage 2: JPEG encode + MQTT publish ----
+    def _publish_loop(self):
+        while self.running:
+            item = self.publish_queue.get(timeout=0.5)
+            if item is None:
+                continue
+            seq, captured_at, frame = item
+            # Quality and frame rate follow the measured publish backlog
+            if not self.stream.should_send(captured_at):
+                continue
+            try:
+                with self.metrics.time("encode"):
+                    payload = encode_frame(frame, seq, captured_at, self.stream.quality)
+                with self.metrics.time("publish"):
+                    self.stream.track(self.publish_frame(payload))
+                self.metrics.inc("frames_published")
+                self.metrics.inc("bytes_published", len(payload))
+            except Exception as e:
+                print(f"Error publishing camera frame: {e}")
+
+    # ---- Stage 3: detect + recognize (worker pool) ----
+    def _detect_loop(self):
+        # Each worker owns its detector; CascadeClassifier is not safe to share
+        detector = self.detector_factory()
+        reset_seq = 0
+        while self.running:
+            item = self.detect_queue.get(timeout=0.5)
+            if item is None:
+                continue
+            seq, captured_at, frame = item
+            if reset_seq < self.detector_reset_seq <= seq:
+                # Tracks from before a static stretch or a resolution change are stale
+                reset_seq = self.detector_reset_seq
+                detector.reset()
+            started = time.perf_counter()
+            try:
+                result = self._process(seq, captured_at, frame, detector)
+            except Exception as e:
+                print(f"Error processing frame {seq}: {e}")
+                continue
+            if self.scheduler is not None:
+                self.scheduler.observe_processing(time.perf_counter() - started)
+                if result.boxes:
+                    self.scheduler.note_activity()
+            if result.boxes and self.motion_gate is not None:
+                self.motion_gate.hold()
+
+            # Workers can finish out of order; never hand an older frame to render
+            with self.result_lock:
+                if seq < self.last_result_seq:
+                    self.metrics.inc("stale_results_dropped")
+                    continue
+                self.last_result_seq = seq
+                self.result_queue.put(result)
+
+    def _process(self, seq, captured_at, frame, detector):
+        metrics = self.metrics
+        recognizer, label_map = self.model
+        with metrics.time("convert"):
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        with metrics.time("detect"):
+            faces = detector.detect(gray)
+        with metrics.time("predict"):
+            boxes, recognized_name, is_recognized = recognize_faces(
+                gray, faces, recognizer, label_map)
+        with metrics.time("draw"):
+            draw_faces(rgb_frame, boxes)
+        metrics.inc("frames_processed")
+        return FrameResult(seq, captured_at, frame, rgb_frame, boxes, recognized_name, is_recognized)
@@ -0,0 +1,239 @@
+# lbp_gallery.py
+import math
+import numpy as np
+
+# ==================================================================
+# NumPy re-implementation of OpenCV's LBPH recognizer.
+#
+# Histograms are computed exactly like cv2.face.LBPHFaceRecognizer with its
+# default parameters (radius 1, 8 neighbors, 8x8 grid) and compared with the
+# same alternative chi-square distance. Labels match the OpenCV backend and
+# confidences agree within float32 rounding (the distance is summed in a
+# different order), so the existing `confidence < 70` threshold still applies.
+# The difference is that the whole gallery is one contiguous float32 matrix
+# and every face in a frame is scored against it in a single vectorized pass.
+# ==================================================================
+
+RADIUS = 1
+NEIGHBORS = 8
+GRID_X = 8
+GRID_Y = 8
+BINS = 2 ** NEIGHBORS
+HIST_SIZE = GRID_X * GRID_Y * BINS
+EPSILON = np.finfo(np.float32).eps
+
+# Upper bound on the temporary (faces x gallery x bins) array, in floats
+CHUNK_FLOATS = 16 * 1024 * 1024
+
+# Two-stage matching: with at least SHORTLIST_MIN_USERS people enrolled, a
+# face is first compared with one mean histogram per person and only the
+# SHORTLIST_USERS closest people's samples are matched in full
+SHORTLIST_USERS = 8
+SHORTLIST_MIN_USERS = 50
+
+
+def lbp_image(gray):
+    """Extended (circular) LBP codes of a grayscale image, as in OpenCV"""
+    src = np.asarray(gray, dtype=np.float32)
+    rows, cols = src.shape
+    center = src[RADIUS:rows - RADIUS, RADIUS:cols - RADIUS]
+    codes = np.zeros(center.shape, dtype=np.int32)
+    for n in range(NEIGHBORS):
+        # Sample point on the circle, bilinearly interpolated. Everything is
+        # kept in float32 like OpenCV so ties against the center pixel match.
+        x = np.float32(RADIUS * math.cos(2.0 * math.pi * n / NEIGHBORS))
+        y = np.float32(-RADIUS * math.sin(2.0 * math.pi * n / NEIGHBORS))
+        fx, fy = int(np.floor(x)), int(np.floor(y))
+        cx, cy = int(np.ceil(x)), int(np.ceil(y))
+        tx, ty = x - np.float32(fx), y - np.float32(fy)
+        one = np.float32(1)
+        w1 = (one - tx) * (one - ty)
+        w2 = tx * (one - ty)
+        w3 = (one - tx) * ty
+        w4 = tx * ty
+
+        def shifted(dy, dx):
+            return src[RADIUS + dy:rows - RADIUS + dy, RADIUS + dx:cols - RADIUS + dx]
+
+        t = w1 * shifted(fy, fx)
+        t += w2 * shifted(fy, cx)
+        t += w3 * shifted(cy, fx)
+        t += w4 * shifted(cy, cx)
+        codes |= ((t > center) | (np.abs(t - center) < EPSILON)).astype(np.int32) << n
+    return codes
+
+
+def lbp_histogram(gray):
+    """Spatial LBP histogram (HIST_SIZE floats) of one face"""
+    codes = lbp_image(gray)
+    height = codes.shape[0] // GRID_Y
+    width = codes.shape[1] // GRID_X
+    if height == 0 or width == 0:
+        return np.zeros(HIST_SIZE, dtype=np.float32)
+
+    # Cell index of every pixel, then one bincount for the whole face
+    cells = codes[:height * GRID_Y, :width * GRID_X]
+    cell_row = (np.arange(cells.shape[0]) // height)[:, None]
+    cell_col = (np.arange(cells.shape[1]) // width)[None, :]
+    flat = ((cell_row * GRID_X + cell_col) * BINS + cells).ravel()
+    counts = np.bincount(flat, minlength=HIST_SIZE)
+    return counts.astype(np.float32) / float(height * width)
+
+
+def chi_square_distances(queries, gallery_t, row_sums=None):
+    """Alternative chi-square distance between every query and gallery histogram.
+
+    cv2.compareHist(..., HISTCMP_CHISQR_ALT) up to float32 rounding, computed
+    for all queries against the bins-major (bins x gallery) matrix at once.
+    It uses
+        sum (g - q)^2 / (g + q) = sum g + sum_{q > 0} q (q - 3g) / (g + q)
+    so only bins that are non-zero in some query are touched (LBP histograms
+    are mostly zeros), and the gallery is processed in chunks so the
+    temporary array stays bounded for large galleries.
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    if row_sums is None:
+        row_sums = gallery_t.sum(axis=0)
+    active = np.flatnonzero(queries.any(axis=0))
+    q = queries[:, active][:, :, None]
+    size = gallery_t.shape[1]
+    distances = np.empty((len(queries), size), dtype=np.float32)
+    chunk = max(1, CHUNK_FLOATS // max(1, len(queries) * len(active)))
+    for start in range(0, size, chunk):
+        stop = min(start + chunk, size)
+        g = gallery_t[active, start:stop][None, :, :]
+        total = g + q
+        total[total == 0] = 1  # q is 0 there as well, so the term is 0
+        terms = q * (q - 3 * g) / total
+        distances[:, start:stop] = 2 * (row_sums[start:stop] + terms.sum(axis=1))
+    # Rounding in the rearranged sum can dip just below zero for exact matches
+    return np.maximum(distances, 0)
+
+
+class LBPGallery:
+    """All gallery histograms in one matrix, with batched matching.
+
+    Drop-in for the parts of LBPHFaceRecognizer the app uses: predict()
+    returns (label, confidence) with -1 for "no match"; predict_batch()
+    scores a whole frame's faces at once. The matrix is stored bins-major
+    (bins x gallery) so gathering the bins a query uses is a contiguous copy.
+
+    Large galleries are searched in two stages (see `shortlist`), so the
+    cost per face grows with the number of people, not of samples. Set
+    `shortlist` to 0 for an exhaustive search.
+    """
+
+    shortlist = SHORTLIST_USERS
+    # (labels, centroids_t, centroid sums, rows per person), built on first use
+    user_index = None
+
+    def __init__(self, histograms, labels, threshold=np.inf):
+        histograms = np.asarray(histograms, dtype=np.float32).reshape(len(labels), HIST_SIZE)
+        self.histograms_t = np.ascontiguousarray(histograms.T)
+        self.row_sums = self.histograms_t.sum(axis=0)
+        self.labels = np.asarray(labels, dtype=np.int32).ravel()
+        self.threshold = threshold
+
+    @property
+    def histograms(self):
+        """(gallery x bins) view of the gallery matrix"""
+        return self.histograms_t.T
+
+    @classmethod
+    def from_transposed(cls, histograms_t, row_sums, labels, threshold=np.inf):
+        """Wrap an existing bins-major matrix (e.g. a memory map) without copying it"""
+        gallery = cls.__new__(cls)
+        gallery.histograms_t = histograms_t
+        gallery.row_sums = row_sums
+        gallery.labels = np.asarray(labels, dtype=np.int32).ravel()
+        gallery.threshold = threshold
+        return gallery
+
+    @classmethod
+    def from_recognizer(cls, recognizer):
+        """Reuse the histograms of a trained cv2 LBPH recognizer"""
+        histograms = recognizer.getHistograms()
+        labels = recognizer.getLabels()
+        if len(histograms) == 0:
+            return cls(np.zeros((0, HIST_SIZE), np.float32), [])
+        return cls(np.vstack([h.reshape(1, -1) for h in histograms]), np.asarray(labels).ravel())
+
+    @classmethod
+    def from_images(cls, images, labels):
+        if not len(images):
+            return cls(np.zeros((0, HIST_SIZE), np.float32), [])
+        return cls(np.vstack([lbp_histogram(img) for img in images]), labels)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def predict(self, face):
+        return self.predict_batch([face])[0]
+
+    def predict_batch(self, faces):
+        """Return [(label, confidence)] for every face crop"""
+        if not len(faces):
+            return []
+        if not len(self.labels):
+            return [(-1, float("inf"))] * len(faces)
+        return self.predict_histograms(np.vstack([lbp_histogram(face) for face in faces]))
+
+    def predict_histograms(self, queries):
+        """predict_batch() for faces whose LBP histograms are already known"""
+        if not len(self.labels):
+            return [(-1, float("inf"))] * len(queries)
+        if self.shortlist and self._index()[0].size >= SHORTLIST_MIN_USERS:
+            distances, labels = self._match_shortlist(queries)
+        else:
+            distances = chi_square_distances(queries, self.histograms_t, self.row_sums)
+            labels = self.labels
+        best = distances.argmin(axis=1)
+        results = []
+        for row, index in enumerate(best):
+            confidence = float(distances[row, index])
+            label = int(labels[index]) if confidence < self.threshold else -1
+            results.append((label, confidence))
+        return results
+
+    # ---- two-stage matching ----
+    def _index(self):
+        if self.user_index is None:
+            self.user_index = self._build_user_index()
+        return self.user_index
+
+    def _build_user_index(self):
+        """Mean histogram and sample columns of every person.
+
+        A person's samples are one contiguous slice of the gallery when it was
+        trained person by person (face_training does), so the second stage
+        can match them without copying the gallery.
+        """
+        users, inverse = np.unique(self.labels, return_inverse=True)
+        centroids_t = np.empty((HIST_SIZE, len(users)), dtype=np.float32)
+        rows = []
+        for i in range(len(users)):
+            columns = np.flatnonzero(inverse == i)
+            if columns[-1] - columns[0] + 1 == len(columns):
+                columns = slice(columns[0], columns[-1] + 1)
+            rows.append(columns)
+            centroids_t[:, i] = self.histograms_t[:, columns].mean(axis=1)
+        return users, centroids_t, centroids_t.sum(axis=0), rows
+
+    def _match_shortlist(self, queries):
+        """Distances to the samples of each query's closest people only.
+
+        Returns (distances, labels) over the union of the frame's shortlists;
+        every query is scored against all of them in one batched pass.
+        """
+        users, centroids_t, centroid_sums, rows = self._index()
+        coarse = chi_square_distances(queries, centroids_t, centroid_sums)
+        count = min(self.shortlist, len(users))
+        chosen = np.unique(np.argpartition(coarse, count - 1, axis=1)[:, :count])
+        distances = []
+        labels = []
+        for i in chosen:
+            columns = rows[i]
+            distances.append(chi_square_distances(queries, self.histograms_t[:, columns],
+                                                  self.row_sums[columns]))
+            labels.append(self.labels[columns])
+        return np.hstack(distances), np.concatenate(labels)
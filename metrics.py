@@ -0,0 +1,205 @@
+# metrics.py
+import collections
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ==================================================================
+# Index:
+#   - ROLLING HISTOGRAM
+#   - METRICS REGISTRY
+#   - MQTT PUBLISHER
+#   - PROMETHEUS TEXT ENDPOINT
+# ==================================================================
+
+PERCENTILES = (50, 90, 99)
+
+
+# =========== ROLLING HISTOGRAM ===========
+class RollingHistogram:
+    """Keeps the most recent `size` samples plus lifetime count and sum"""
+
+    def __init__(self, size=512):
+        self.samples = collections.deque(maxlen=size)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        # deque.append is atomic, so hot paths need no lock
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def summary(self):
+        values = sorted(self.samples)
+        summary = {"count": self.count, "sum": self.total}
+        for p in PERCENTILES:
+            summary[f"p{p}"] = values[min(len(values) - 1, len(values) * p // 100)] if values else 0.0
+        summary["max"] = values[-1] if values else 0.0
+        return summary
+
+
+class _StageTimer:
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMER = _NullTimer()
+
+
+# =========== METRICS REGISTRY ===========
+class Metrics:
+    """Per-stage latency histograms, counters and gauges for the hot path.
+
+    When disabled every call returns immediately (time() hands back a shared
+    no-op context manager), so instrumentation can stay in place permanently.
+    Gauges are callables evaluated only when a snapshot is taken, which keeps
+    things like queue depths off the hot path entirely.
+    """
+
+    def __init__(self, enabled=True, window=512):
+        self.enabled = enabled
+        self.window = window
+        self.histograms = {}
+        self.counters = collections.Counter()
+        self.gauges = {}
+        self.lock = threading.Lock()
+
+    def time(self, stage):
+        """Context manager timing one pass through `stage` (seconds)"""
+        if not self.enabled:
+            return NULL_TIMER
+        return _StageTimer(self, stage)
+
+    def observe(self, stage, seconds):
+        if not self.enabled:
+            return
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(stage, RollingHistogram(self.window))
+        histogram.observe(seconds)
+
+    def inc(self, name, amount=1):
+        if self.enabled:
+            self.counters[name] += amount
+
+    def gauge(self, name, read):
+        """Register a callable returning the current value of `name`"""
+        self.gauges[name] = read
+
+    def snapshot(self):
+        stages = {}
+        for stage, histogram in list(self.histograms.items()):
+            summary = histogram.summary()
+            # Report latencies in milliseconds
+            stages[stage] = {key: (value * 1000 if key != "count" else value)
+                             for key, value in summary.items()}
+        gauges = {}
+        for name, read in list(self.gauges.items()):
+            try:
+                gauges[name] = read()
+            except Exception:
+                continue
+        return {
+            "timestamp": time.time(),
+            "stages_ms": stages,
+            "counters": dict(self.counters),
+            "gauges": gauges,
+        }
+
+
+# =========== MQTT PUBLISHER ===========
+class MetricsPublisher:
+    """Publishes a metrics snapshot every `interval` seconds"""
+
+    def __init__(self, metrics, publish, topic="smartlock/metrics", interval=5.0):
+        self.metrics = metrics
+        self.publish = publish
+        self.topic = topic
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if not self.metrics.enabled:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+            self.thread = None
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.publish(self.topic, json.dumps(self.metrics.snapshot()))
+            except Exception as e:
+                print(f"Error publishing metrics: {e}")
+
+
+# =========== PROMETHEUS TEXT ENDPOINT ===========
+def prometheus_text(snapshot, prefix="smartlock"):
+    """Render a snapshot in the Prometheus text exposition format"""
+    lines = []
+    for stage, summary in sorted(snapshot["stages_ms"].items()):
+        name = f"{prefix}_stage_latency_ms"
+        for p in PERCENTILES:
+            lines.append(f'{name}{{stage="{stage}",quantile="0.{p}"}} {summary[f"p{p}"]:.3f}')
+        lines.append(f'{name}_count{{stage="{stage}"}} {summary["count"]}')
+        lines.append(f'{name}_sum{{stage="{stage}"}} {summary["sum"]:.3f}')
+    for counter, value in sorted(snapshot["counters"].items()):
+        lines.append(f"{prefix}_{counter}_total {value}")
+    for gauge, value in sorted(snapshot["gauges"].items()):
+        if isinstance(value, (int, float)):
+            lines.append(f"{prefix}_{gauge} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def start_http_server(metrics, port, host="0.0.0.0"):
+    """Serve /metrics in Prometheus text format from a daemon thread"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = prometheus_text(metrics.snapshot()).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Keep scrapes out of the console
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
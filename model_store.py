@@ -0,0 +1,236 @@
+# model_store.py
+"""Compact binary gallery format for the NumPy LBPH backend.
+
+OpenCV's trained_model.yml stores every histogram as text, which grows to
+tens of megabytes and seconds of parsing as people are enrolled. The
+.lbpg file next to it holds the same gallery as packed little-endian
+arrays that are memory-mapped on load, so opening it costs the same
+whatever the number of users; pages are read in as matching touches them.
+
+Layout (every array starts on a 64-byte boundary):
+
+    header      HEADER struct below
+    metadata    UTF-8 JSON (format version, creation time, source model)
+    labels      int32[count]
+    row_sums    float32[count]          per-histogram sums, for matching
+    histograms  float32[hist_size, count]  bins-major, as LBPGallery keeps it
+
+    python model_store.py convert                      # data/trained_model.yml -> .lbpg
+    python model_store.py info data/trained_model.lbpg
+    python model_store.py retrain                      # rebuild from the enrolled faces
+"""
+import argparse
+import datetime
+import json
+import os
+import struct
+import threading
+import numpy as np
+import lbp_gallery
+from lbp_gallery import LBPGallery
+
+MAGIC = b"LBPG"
+FORMAT_VERSION = 1
+ALIGN = 64
+EXTENSION = ".lbpg"
+# Windows cannot replace a file that is memory-mapped, and retraining
+# replaces the gallery under a running service, so read it into memory there
+MMAP_DEFAULT = os.name != "nt"
+
+#   magic 4s, version H, flags H, count I, hist_size I,
+#   radius I, neighbors I, grid_x I, grid_y I, threshold d, metadata length I
+HEADER = struct.Struct("<4sHHIIIIIIdI")
+
+
+def gallery_path_for(model_path):
+    """data/trained_model.yml -> data/trained_model.lbpg"""
+    return os.path.splitext(model_path)[0] + EXTENSION
+
+
+def _align(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _layout(count, hist_size, meta_len):
+    """Byte offsets of (labels, row_sums, histograms) and the total file size"""
+    labels = _align(HEADER.size + meta_len)
+    row_sums = _align(labels + 4 * count)
+    histograms = _align(row_sums + 4 * count)
+    return labels, row_sums, histograms, histograms + 4 * hist_size * count
+
+
+def _source_stamp(model_path):
+    stat = os.stat(model_path)
+    return {"source": os.path.basename(model_path), "source_size": stat.st_size,
+            "source_mtime_ns": stat.st_mtime_ns}
+
+
+# =========== WRITE ===========
+def save(gallery, path, source=None, settings=None):
+    """Write an LBPGallery to `path` atomically (temp file + rename).
+
+    `source` is the YAML model it was built from; its size and mtime are
+    recorded so is_current() can tell when the binary file is stale.
+    `settings` are the training settings to keep with the model (see
+    face_training.model_settings()); unknown (None) values are left out.
+    """
+    count = len(gallery)
+    metadata = {"format": FORMAT_VERSION, "created": datetime.datetime.now().isoformat()}
+    for key, value in (settings or {}).items():
+        if value is not None:
+            metadata[key] = value
+    if source is not None and os.path.exists(source):
+        metadata.update(_source_stamp(source))
+    meta = json.dumps(metadata).encode("utf-8")
+    labels_at, sums_at, hist_at, size = _layout(count, lbp_gallery.HIST_SIZE, len(meta))
+
+    threshold = float(gallery.threshold)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, 0, count, lbp_gallery.HIST_SIZE,
+                         lbp_gallery.RADIUS, lbp_gallery.NEIGHBORS,
+                         lbp_gallery.GRID_X, lbp_gallery.GRID_Y, threshold, len(meta))
+
+    # The trainer and a service converting a stale model may write the same
+    # gallery at once; each needs its own temp file or one renames the
+    # other's half-written file into place
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(header + meta)
+            for offset, array in ((labels_at, gallery.labels.astype("<i4")),
+                                  (sums_at, gallery.row_sums.astype("<f4")),
+                                  (hist_at, gallery.histograms_t.astype("<f4"))):
+                f.seek(offset)
+                f.write(np.ascontiguousarray(array).tobytes())
+            f.truncate(size)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+# =========== READ ===========
+def read_header(path):
+    """Return (header dict, metadata dict) without touching the arrays"""
+    with open(path, "rb") as f:
+        raw = f.read(HEADER.size)
+        if len(raw) < HEADER.size:
+            raise ValueError(f"{path}: truncated gallery header")
+        (magic, version, flags, count, hist_size, radius, neighbors,
+         grid_x, grid_y, threshold, meta_len) = HEADER.unpack(raw)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not an .lbpg gallery")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported gallery version {version}")
+        metadata = json.loads(f.read(meta_len).decode("utf-8"))
+    header = {
+        "version": version,
+        "count": count,
+        "hist_size": hist_size,
+        "radius": radius,
+        "neighbors": neighbors,
+        "grid_x": grid_x,
+        "grid_y": grid_y,
+        "threshold": threshold,
+        "meta_len": meta_len,
+    }
+    return header, metadata
+
+
+def load(path, mmap=MMAP_DEFAULT):
+    """Open an .lbpg file as an LBPGallery.
+
+    With mmap=True the histogram matrix is a read-only memory map of the
+    file and only the labels are copied; otherwise the file is read in one
+    go. Raises ValueError for files written with different LBP parameters
+    than lbp_gallery uses.
+    """
+    header, _ = read_header(path)
+    expected = (lbp_gallery.HIST_SIZE, lbp_gallery.RADIUS, lbp_gallery.NEIGHBORS,
+                lbp_gallery.GRID_X, lbp_gallery.GRID_Y)
+    found = (header["hist_size"], header["radius"], header["neighbors"],
+             header["grid_x"], header["grid_y"])
+    if found != expected:
+        raise ValueError(f"{path}: LBP parameters {found} do not match {expected}")
+
+    count = header["count"]
+    labels_at, sums_at, hist_at, size = _layout(count, header["hist_size"], header["meta_len"])
+    if os.path.getsize(path) < size:
+        raise ValueError(f"{path}: truncated gallery data")
+
+    if mmap and count:
+        data = np.memmap(path, dtype=np.uint8, mode="r", shape=(size,))
+    else:
+        data = np.fromfile(path, dtype=np.uint8, count=size)
+    labels = np.array(data[labels_at:labels_at + 4 * count].view("<i4"))
+    row_sums = data[sums_at:sums_at + 4 * count].view("<f4")
+    histograms_t = data[hist_at:size].view("<f4").reshape(header["hist_size"], count)
+    return LBPGallery.from_transposed(histograms_t, row_sums, labels, header["threshold"])
+
+
+def is_current(path, model_path):
+    """True if `path` exists and was built from the current `model_path`.
+
+    A gallery without a YAML model next to it (binary-only deployment)
+    counts as current.
+    """
+    if not os.path.exists(path):
+        return False
+    if not os.path.exists(model_path):
+        return True
+    try:
+        _, metadata = read_header(path)
+    except ValueError:
+        return False
+    stamp = _source_stamp(model_path)
+    return all(metadata.get(key) == value for key, value in stamp.items() if key != "source")
+
+
+# =========== CLI ===========
+def retrain():
+    import face_training
+    from mqtt_bus import get_bus
+
+    label_ids = face_training.train_full()
+    if not label_ids:
+        raise SystemExit(f"No faces to train from in {face_training.FACE_DIR}")
+    print(f"Retrained {face_training.MODEL_PATH} for {len(label_ids)} people")
+    # Same retained event as register_faces.py, so running services reload
+    bus = get_bus("ModelStore")
+    bus.publish("smartlock/model", json.dumps(face_training.model_event()), qos=2, retain=True)
+    if not bus.wait_connected(timeout=2):
+        print("MQTT broker not reachable; restart running recognition services to load the model")
+    bus.close()
+
+
+def main():
+    from face_training import MODEL_PATH, export_gallery
+
+    parser = argparse.ArgumentParser(description="Convert, inspect and retrain LBPH galleries")
+    sub = parser.add_subparsers(dest="command", required=True)
+    convert = sub.add_parser("convert", help="Build the .lbpg file from an OpenCV LBPH YAML model")
+    convert.add_argument("model", nargs="?", default=MODEL_PATH)
+    convert.add_argument("-o", "--output", help="Defaults to the model path with an .lbpg extension")
+    info = sub.add_parser("info", help="Show the header and metadata of an .lbpg file")
+    info.add_argument("path", nargs="?", default=gallery_path_for(MODEL_PATH))
+    sub.add_parser("retrain", help="Retrain the model from the enrolled faces (e.g. after a "
+                                   "preprocessing change) and tell running services to reload it")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        if not os.path.exists(args.model):
+            raise SystemExit(f"Model not found: {args.model}")
+        output = args.output or gallery_path_for(args.model)
+        gallery = export_gallery(args.model, output)
+        print(f"Wrote {output}: {len(gallery)} histograms, "
+              f"{os.path.getsize(output) / 1024:.0f} KiB (YAML {os.path.getsize(args.model) / 1024:.0f} KiB)")
+    elif args.command == "retrain":
+        retrain()
+    else:
+        header, metadata = read_header(args.path)
+        for key, value in list(header.items()) + list(metadata.items()):
+            print(f"{key:<16} {value}")
+
+
+if __name__ == "__main__":
+    main()
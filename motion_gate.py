@@ -0,0 +1,88 @@
+# motion_gate.py
+import time
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """Low-resolution frame-difference check in front of face detection.
+
+    Each frame is shrunk to `size`, blurred and compared with a slowly
+    updated background. When more than `min_fraction` of the pixels differ
+    by more than `pixel_threshold`, the gate opens on that very frame and
+    stays open for `hold_seconds` after the last motion. While it is closed
+    the doorway is static and the pipeline skips detection.
+
+    A person standing still at the door makes no motion, so the pipeline
+    calls hold() whenever faces are in view to keep the gate open.
+
+    check() is meant for a single thread (the capture stage); hold() may be
+    called from any worker.
+    """
+
+    def __init__(self, size=(80, 60), pixel_threshold=25, min_fraction=0.005,
+                 hold_seconds=2.0, learn_rate=0.05):
+        self.size = size
+        self.pixel_threshold = pixel_threshold
+        self.min_fraction = min_fraction
+        self.hold_seconds = hold_seconds
+        self.learn_rate = learn_rate
+
+        self.background = None
+        self.first_is_motion = True
+        self.active_until = 0.0
+        self.active = True
+
+        # Counters
+        self.passed = 0
+        self.skipped = 0
+        self.wakeups = 0
+
+    def check(self, frame, now=None):
+        """True if this frame should go through detection"""
+        now = time.time() if now is None else now
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        small = cv2.GaussianBlur(small, (5, 5), 0).astype(np.float32)
+
+        if self.background is None:
+            self.background = small
+            motion = self.first_is_motion
+        else:
+            changed = np.count_nonzero(cv2.absdiff(small, self.background) > self.pixel_threshold)
+            motion = changed >= self.min_fraction * small.size
+            # Lighting drifts and objects left behind fade into the background
+            cv2.accumulateWeighted(small, self.background, self.learn_rate)
+        if motion:
+            self.active_until = max(self.active_until, now + self.hold_seconds)
+
+        active = now < self.active_until
+        if active and not self.active:
+            self.wakeups += 1
+        self.active = active
+        if active:
+            self.passed += 1
+        else:
+            self.skipped += 1
+        return active
+
+    def reset(self):
+        """Relearn the background from the next frame (e.g. after a resolution
+        change), without counting the change itself as motion"""
+        self.background = None
+        self.first_is_motion = False
+
+    def hold(self, now=None):
+        """Keep the gate open for another hold_seconds (faces are in view)"""
+        now = time.time() if now is None else now
+        self.active_until = max(self.active_until, now + self.hold_seconds)
+
+    def stats(self):
+        total = self.passed + self.skipped
+        return {
+            "passed": self.passed,
+            "skipped": self.skipped,
+            "wakeups": self.wakeups,
+            "skipped_ratio": self.skipped / total if total else 0.0,
+        }
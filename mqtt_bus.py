@@ -0,0 +1,269 @@
+# mqtt_bus.py
+import collections
+import threading
+import paho.mqtt.client as mqtt
+
+BROKER_HOST = "localhost"
+BROKER_PORT = 1883
+
+# Outbound drop policies
+DROP_OLDEST = "drop_oldest"  # Keep only the newest `limit` queued messages
+NEVER_DROP = "never_drop"    # Queue until the broker has taken it
+
+# (topic filter, policy, limit); first match wins. Topics not listed fall
+# back on their QoS: QoS 0 is best-effort (DROP_OLDEST, max_pending per
+# topic), QoS 1/2 is never dropped.
+TOPIC_POLICIES = [
+    ("smartlock/camera", DROP_OLDEST, 2),
+    ("smartlock/+/camera", DROP_OLDEST, 2),
+    ("smartlock/recognition", DROP_OLDEST, 5),
+    ("smartlock/+/recognition", DROP_OLDEST, 5),
+    ("smartlock/metrics", DROP_OLDEST, 1),
+    ("smartlock/+/metrics", DROP_OLDEST, 1),
+    ("smartlock/control", NEVER_DROP, None),
+]
+
+# ==================================================================
+# Index:
+#   - OUTGOING MESSAGE
+#   - MQTT BUS
+#   - PROCESS-WIDE BUS
+# ==================================================================
+
+
+# =========== OUTGOING MESSAGE ===========
+class OutgoingMessage:
+    """Handle returned by MqttBus.publish().
+
+    is_published() has the same meaning as on paho's MQTTMessageInfo, so it
+    can be handed to frame_codec.AdaptiveStreamController.track(). A dropped
+    message counts as done, like a publish that failed.
+    """
+
+    def __init__(self, topic, payload, qos, retain, key):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.key = key
+        self.info = None
+        self.dropped = False
+
+    def is_published(self):
+        if self.dropped:
+            return True
+        if self.info is None:
+            return False
+        try:
+            return self.info.is_published()
+        except Exception:
+            # Raised when the publish itself failed
+            return True
+
+
+# =========== MQTT BUS ===========
+class MqttBus:
+    """One MQTT connection per process with a queued, non-blocking publish.
+
+    publish() only appends to the outbound queue and returns at once; a
+    sender thread hands messages to paho while the connection is up and
+    fewer than max_in_flight are still unacknowledged. When the broker link
+    falls behind (or is down), the queue absorbs it according to each
+    topic's drop policy: camera frames are replaced by newer ones, control
+    commands are kept until delivered. paho reconnects on its own and every
+    subscription is renewed on each connect.
+    """
+
+    def __init__(self, client_id, host=BROKER_HOST, port=BROKER_PORT,
+                 max_pending=1000, max_in_flight=20, policies=TOPIC_POLICIES):
+        self.client_id = client_id
+        self.host = host
+        self.port = port
+        self.max_pending = max_pending
+        self.max_in_flight = max_in_flight
+        self.policies = policies
+
+        self.client = mqtt.Client(client_id)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_publish = self._on_publish
+        self.client.reconnect_delay_set(min_delay=1, max_delay=30)
+
+        self.cond = threading.Condition()
+        self.pending = collections.deque()  # FIFO send order, may hold dropped entries
+        self.queued = collections.defaultdict(collections.deque)  # live messages per policy key
+        self.sent = collections.deque()  # handed to paho, maybe not yet acknowledged
+        self.subscriptions = {}
+        self.connect_handlers = []
+        self.connected = False
+        self.running = False
+        self.thread = None
+
+        self.backlog = 0
+        self.published = 0
+        self.reconnects = 0
+        self.dropped = collections.Counter()
+
+    # ---- lifecycle ----
+    def start(self):
+        # connect_async + loop_start keeps retrying until the broker is up
+        self.running = True
+        self.client.connect_async(self.host, self.port)
+        self.client.loop_start()
+        self.thread = threading.Thread(target=self._send_loop, daemon=True)
+        self.thread.start()
+        return self
+
+    def wait_connected(self, timeout=None):
+        with self.cond:
+            return self.cond.wait_for(lambda: self.connected, timeout)
+
+    def close(self, timeout=2.0):
+        """Give queued messages up to `timeout` seconds to go out, then disconnect"""
+        if not self.running:
+            return
+        with self.cond:
+            self.cond.wait_for(lambda: not self.backlog or not self.connected, timeout)
+            self.running = False
+            self.cond.notify_all()
+        self.thread.join(timeout=1)
+        self.client.loop_stop()
+        self.client.disconnect()
+
+    # ---- subscribe ----
+    def subscribe(self, topic, qos, handler):
+        """Route messages matching `topic` to handler(client, userdata, msg)"""
+        self.client.message_callback_add(topic, handler)
+        with self.cond:
+            self.subscriptions[topic] = qos
+            connected = self.connected
+        if connected:
+            self.client.subscribe(topic, qos)
+
+    def add_connect_handler(self, handler):
+        """Call handler() after every (re)connect"""
+        self.connect_handlers.append(handler)
+
+    # ---- publish ----
+    def publish(self, topic, payload, qos=0, retain=False):
+        policy, limit, key = self._policy(topic, qos)
+        message = OutgoingMessage(topic, payload, qos, retain, key)
+        with self.cond:
+            queued = self.queued[key]
+            if policy == DROP_OLDEST:
+                while len(queued) >= limit:
+                    old = queued.popleft()
+                    old.dropped = True
+                    self.backlog -= 1
+                    self.dropped[key] += 1
+            queued.append(message)
+            self.pending.append(message)
+            self.backlog += 1
+            self.cond.notify_all()
+        return message
+
+    def _policy(self, topic, qos):
+        for pattern, policy, limit in self.policies:
+            if mqtt.topic_matches_sub(pattern, topic):
+                return policy, limit, pattern
+        if qos == 0:
+            return DROP_OLDEST, self.max_pending, topic
+        return NEVER_DROP, None, topic
+
+    def _send_loop(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: not self.running or self._can_send())
+                if not self.running:
+                    return
+                message = self.pending.popleft()
+                if message.dropped:
+                    continue
+                self.queued[message.key].popleft()
+                self.backlog -= 1
+            message.info = self.client.publish(message.topic, message.payload,
+                                               qos=message.qos, retain=message.retain)
+            with self.cond:
+                self.sent.append(message)
+                self.published += 1
+
+    def _can_send(self):
+        return self.connected and self.pending and self._count_in_flight() < self.max_in_flight
+
+    def _count_in_flight(self):
+        while self.sent and self.sent[0].is_published():
+            self.sent.popleft()
+        return len(self.sent)
+
+    # ---- paho callbacks ----
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            print(f"MQTT connection refused ({mqtt.connack_string(rc)})")
+            return
+        print(f"{self.client_id} connected to MQTT broker")
+        with self.cond:
+            self.connected = True
+            subscriptions = list(self.subscriptions.items())
+            self.cond.notify_all()
+        if subscriptions:
+            client.subscribe(subscriptions)
+        for handler in self.connect_handlers:
+            handler()
+
+    def _on_disconnect(self, client, userdata, rc):
+        with self.cond:
+            self.connected = False
+            if self.running and rc != 0:
+                self.reconnects += 1
+                print(f"{self.client_id} lost MQTT connection, reconnecting...")
+            self.cond.notify_all()
+
+    def _on_publish(self, client, userdata, mid):
+        with self.cond:
+            self.cond.notify_all()
+
+    # ---- counters ----
+    @property
+    def in_flight(self):
+        with self.cond:
+            return self._count_in_flight()
+
+    def stats(self):
+        with self.cond:
+            return {
+                "connected": self.connected,
+                "backlog": self.backlog,
+                "in_flight": self._count_in_flight(),
+                "published": self.published,
+                "dropped": sum(self.dropped.values()),
+                "dropped_by_topic": dict(self.dropped),
+                "reconnects": self.reconnects,
+            }
+
+    def register_metrics(self, metrics):
+        """Export the bus counters as metrics.Metrics gauges"""
+        metrics.gauge("mqtt_connected", lambda: int(self.connected))
+        metrics.gauge("mqtt_backlog", lambda: self.backlog)
+        metrics.gauge("mqtt_in_flight", lambda: self.in_flight)
+        metrics.gauge("mqtt_published", lambda: self.published)
+        metrics.gauge("mqtt_dropped", lambda: sum(self.dropped.values()))
+        metrics.gauge("mqtt_reconnects", lambda: self.reconnects)
+
+
+# =========== PROCESS-WIDE BUS ===========
+_bus = None
+_bus_lock = threading.Lock()
+
+
+def get_bus(client_id, host=BROKER_HOST, port=BROKER_PORT):
+    """Return this process's bus, starting it on first use.
+
+    Later calls get the same connection whatever client_id they pass, so
+    every component in a process shares one MQTT session. Module state
+    also survives Streamlit reruns.
+    """
+    global _bus
+    with _bus_lock:
+        if _bus is None:
+            _bus = MqttBus(client_id, host, port).start()
+        return _bus
@@ -0,0 +1,105 @@
+# multi_camera.py
+"""Run recognition for several doors, one worker process per camera.
+
+Each door gets its own process running a RecognitionService (capture,
+detector, recognizer, access state machine and MQTT connection), so doors
+scale across CPU cores instead of sharing one interpreter. Topics are per
+door, e.g.:
+
+    smartlock/<door>/camera   binary camera frames (see frame_codec.py)
+    smartlock/<door>/access   access decisions (same payload as smartlock/access plus "door")
+    smartlock/<door>/status   retained door state
+    smartlock/<door>/control  admin commands for this door only
+
+Commands on the global smartlock/control reach every door only if they are
+in recognition_service.BROADCAST_COMMANDS (an emergency lockdown).
+
+See recognition_service.py for the full topic list.
+
+Sources are device indices or video files:
+
+    python multi_camera.py --door front=0 --door back=1
+    python multi_camera.py --door lab=recordings/lab.mp4 --detection full
+"""
+import argparse
+import multiprocessing
+import time
+from recognition_service import RecognitionService, parse_source
+
+
+def run_door(door, source, options, stop_event):
+    """Worker process: one RecognitionService under smartlock/<door>"""
+    source = parse_source(source)
+    service = RecognitionService(
+        source, client_id=f"Camera-{door}", prefix=f"smartlock/{door}", door=door,
+        # Keep retrying a webcam; a video file just ends
+        reopen_delay=5 if isinstance(source, int) else None,
+        **options)
+    service.run(stop_event)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Multi-camera face recognition, one process per door")
+    parser.add_argument("--door", action="append", required=True, metavar="NAME=SOURCE",
+                        help="Door name and camera index or video file, e.g. front=0 (repeatable)")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--backend", choices=("opencv", "numpy"), default="numpy")
+    parser.add_argument("--detection", choices=("full", "tracking"), default="tracking")
+    parser.add_argument("--workers", type=int, default=2, help="Detection threads per door in full mode")
+    parser.add_argument("--detect-every", type=int, default=5)
+    parser.add_argument("--detect-scale", type=float, default=0.5)
+    parser.add_argument("--vote-window", type=int, default=10)
+    parser.add_argument("--min-votes", type=int, default=6)
+    parser.add_argument("--no-motion-gate", action="store_true",
+                        help="Run detection on every frame even when nothing moves")
+    parser.add_argument("--no-capture-scheduler", action="store_true",
+                        help="Keep cameras at their default resolution and frame rate")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    options = {
+        "host": args.host,
+        "port": args.port,
+        "backend": args.backend,
+        "detection": args.detection,
+        "workers": args.workers,
+        "detect_every": args.detect_every,
+        "detect_scale": args.detect_scale,
+        "vote_window": args.vote_window,
+        "min_votes": args.min_votes,
+        "motion_gate": not args.no_motion_gate,
+        "capture_scheduler": not args.no_capture_scheduler,
+    }
+
+    doors = []
+    for spec in args.door:
+        name, _, source = spec.partition("=")
+        if not name or not source or "/" in name:
+            raise SystemExit(f"Invalid --door {spec!r}, expected NAME=SOURCE")
+        doors.append((name, source))
+
+    stop_event = multiprocessing.Event()
+    processes = [multiprocessing.Process(target=run_door, args=(name, source, options, stop_event),
+                                         name=f"door-{name}")
+                 for name, source in doors]
+    for process in processes:
+        process.start()
+
+    try:
+        while any(process.is_alive() for process in processes):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("Stopping cameras...")
+    finally:
+        stop_event.set()
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+
+if __name__ == "__main__":
+    main()
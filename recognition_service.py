@@ -0,0 +1,337 @@
+# recognition_service.py
+"""Headless recognition daemon: camera -> detect/recognize -> access decisions.
+
+Owns the camera, the recognizer and the MQTT connection for one door and
+keeps running whether or not anyone has the Streamlit page open. Everything
+it produces goes out over MQTT under its topic prefix (default "smartlock"):
+
+    <prefix>/camera        binary camera frames (see frame_codec.py), QoS 0
+    <prefix>/recognition   per-frame result JSON (seq, boxes, name), QoS 0
+    <prefix>/access        access decisions on transitions, QoS 2
+    <prefix>/status        retained door state (locked, emergency), QoS 2
+    <prefix>/metrics       pipeline metrics snapshot (see metrics.py)
+
+It listens to smartlock/control (admin unlock/lockdown) and smartlock/model,
+where register_faces.py announces a retrained model; the new model is
+loaded in the background and swapped in between frames, so enrollment
+needs no restart. face_recognition_app.py is a viewer over these topics.
+
+    python recognition_service.py
+    python recognition_service.py --source recordings/door.mp4 --detection full
+"""
+import argparse
+import datetime
+import json
+import threading
+import time
+import cv2
+from mqtt_bus import get_bus
+from frame_pipeline import FramePipeline
+from frame_codec import AdaptiveStreamController, CAMERA_QOS
+from motion_gate import MotionGate
+from capture_scheduler import CaptureScheduler
+from face_tracking import make_detector_factory
+from face_training import load_recognizer, model_version, empty_gallery
+from access_decision import AccessDecision, GRANTED, NO_ONE, access_event
+from metrics import Metrics, MetricsPublisher, start_http_server
+# For PC buzzer sound simulation (Windows only)
+try:
+    import winsound
+except ImportError:
+    winsound = None
+
+# Recognizer backend: "opencv" uses LBPHFaceRecognizer.predict per face,
+# "numpy" scores every face in a frame against the gallery matrix at once
+RECOGNIZER_BACKEND = "numpy"
+# Number of parallel detect/recognize workers in the frame pipeline
+DETECTION_WORKERS = 2
+# Detection mode: "full" runs the cascade on every full-resolution frame,
+# "tracking" runs it on a downscaled frame every DETECT_EVERY_N frames and
+# tracks faces in between (much cheaper on Pi-class hardware)
+DETECTION_MODE = "tracking"
+DETECT_EVERY_N = 5
+DETECT_SCALE = 0.5
+# Skip detection while nothing moves in front of the camera, and publish
+# the camera stream at IDLE_STREAM_FPS meanwhile (None keeps the full rate)
+MOTION_GATE = True
+IDLE_STREAM_FPS = 2
+# Drop a webcam to a low resolution/frame rate while the doorway is empty,
+# and read frames no faster than the workers can process them
+CAPTURE_SCHEDULER = True
+# Per-frame results are disposable like the frames: QoS 0, no PUBACK round trip
+RESULT_QOS = 0
+ACCESS_QOS = 2
+# An access decision needs ACCESS_MIN_VOTES of the last ACCESS_VOTE_WINDOW frames
+ACCESS_VOTE_WINDOW = 10
+ACCESS_MIN_VOTES = 6
+# register_faces.py announces every retrained model here (retained)
+MODEL_TOPIC = "smartlock/model"
+# Admin commands go to <prefix>/control. A door under its own prefix
+# (multi_camera.py) also obeys these commands on the global topic, so an
+# emergency lockdown still reaches every door but an unlock does not
+CONTROL_TOPIC = "smartlock/control"
+BROADCAST_COMMANDS = ("lockdown",)
+# Seconds to wait before reopening a camera that stopped delivering frames
+CAMERA_REOPEN_DELAY = 5
+# Per-stage metrics published every METRICS_INTERVAL seconds; set
+# METRICS_HTTP_PORT to also serve Prometheus text on /metrics
+METRICS_ENABLED = True
+METRICS_INTERVAL = 5
+METRICS_HTTP_PORT = None
+
+
+def sound_alarm(duration=1000, frequency=800):
+    """Simulate alarm sound on PC"""
+    try:
+        # Windows-specific sound (duration in ms, freq in Hz)
+        winsound.Beep(frequency, duration)
+    except Exception:
+        # Fallback for non-Windows systems
+        print("ALARM SOUND: Cannot play on this system")
+
+
+class RecognitionService:
+    """Runs the frame pipeline for one camera and publishes its results.
+
+    Recognition never depends on a UI being attached: results, access
+    events and the door status are published over MQTT, and a camera that
+    stops delivering frames is reopened after reopen_delay seconds (pass
+    None to stop instead, e.g. when replaying a video file).
+    """
+
+    def __init__(self, source=0, client_id="RecognitionService", host="localhost", port=1883,
+                 prefix="smartlock", door=None, backend=RECOGNIZER_BACKEND,
+                 detection=DETECTION_MODE, workers=DETECTION_WORKERS,
+                 detect_every=DETECT_EVERY_N, detect_scale=DETECT_SCALE,
+                 vote_window=ACCESS_VOTE_WINDOW, min_votes=ACCESS_MIN_VOTES,
+                 reopen_delay=CAMERA_REOPEN_DELAY, motion_gate=MOTION_GATE,
+                 capture_scheduler=CAPTURE_SCHEDULER, metrics=None):
+        self.source = source
+        self.prefix = prefix
+        self.door = door
+        self.reopen_delay = reopen_delay
+        self.motion_gate = motion_gate
+        self.capture_scheduler = capture_scheduler
+        self.metrics = metrics or Metrics(enabled=METRICS_ENABLED)
+
+        # Startup cost (model load, cascade) is paid once per process; later
+        # models are loaded in the background and swapped in between frames
+        self.backend = backend
+        try:
+            self.recognizer, self.label_map = load_recognizer(backend)
+            self.model_version = model_version()
+        except Exception as e:
+            # Keep the camera, stream and door state running and deny everyone;
+            # the next announced model (e.g. `model_store.py retrain`) is loaded
+            print(f"Could not load the model, recognizing no one until a new one is trained: {e}")
+            self.recognizer, self.label_map = empty_gallery(), {}
+            self.model_version = None
+        self.reload_lock = threading.Lock()
+        self.pipeline = None
+        self.detector_factory, self.workers = make_detector_factory(
+            detection, workers, detect_every, detect_scale)
+        # Votes over recent frames; access events go out only on transitions
+        self.decision = AccessDecision(window=vote_window, min_votes=min_votes)
+        self.is_locked = True
+        self.emergency_mode = False
+
+        # One queued MQTT connection for everything this process publishes
+        self.bus = get_bus(client_id, host, port)
+        self.bus.register_metrics(self.metrics)
+        self.control_topic = f"{prefix}/control"
+        self.bus.subscribe(self.control_topic, 2, self.on_message)  # Admin commands - QoS 2
+        if self.control_topic != CONTROL_TOPIC:
+            self.bus.subscribe(CONTROL_TOPIC, 2, self.on_message)  # Broadcast commands - QoS 2
+        self.bus.subscribe(MODEL_TOPIC, 2, self.on_model)  # Model updates - QoS 2
+        self.metrics_publisher = MetricsPublisher(
+            self.metrics, lambda topic, payload: self.bus.publish(topic, payload, qos=0),
+            topic=f"{prefix}/metrics", interval=METRICS_INTERVAL)
+
+    # =========== MQTT ===========
+    def on_message(self, client, userdata, msg):
+        try:
+            data = json.loads(msg.payload)
+            # The global topic only carries broadcast commands to a per-door service
+            own_topic = msg.topic == self.control_topic
+            if data.get("source") == "admin" and (own_topic or data.get("command") in BROADCAST_COMMANDS):
+                if data["command"] == "unlock":
+                    self.is_locked = False
+                    self.emergency_mode = False
+                elif data["command"] == "lockdown":
+                    self.is_locked = True
+                    self.emergency_mode = True
+                    threading.Thread(target=sound_alarm, args=(2000, 1000), daemon=True).start()
+                self.publish_status()
+        except Exception as e:
+            print(f"Error processing MQTT message: {e}")
+
+    def on_model(self, client, userdata, msg):
+        try:
+            version = json.loads(msg.payload).get("version")
+        except Exception as e:
+            print(f"Error processing model event: {e}")
+            return
+        if version != self.model_version:
+            # Never load on the MQTT thread; the camera loop keeps running meanwhile
+            threading.Thread(target=self.reload_model, daemon=True).start()
+
+    def reload_model(self):
+        """Load the model currently on disk and swap it in if it is new"""
+        with self.reload_lock:
+            version = model_version()
+            if version == self.model_version:
+                return
+            started = time.perf_counter()
+            try:
+                recognizer, label_map = load_recognizer(self.backend)
+            except Exception as e:
+                print(f"Model reload failed, keeping the current model: {e}")
+                return
+            self.recognizer, self.label_map = recognizer, label_map
+            self.model_version = version
+            pipeline = self.pipeline
+            if pipeline is not None:
+                pipeline.swap_model(recognizer, label_map)
+            self.metrics.inc("model_reloads")
+            print(f"Loaded model {version} ({len(label_map)} users) in "
+                  f"{time.perf_counter() - started:.2f}s")
+
+    def publish_status(self):
+        """Retained, so a viewer that attaches later sees the door state at once"""
+        status = {
+            "locked": self.is_locked,
+            "emergency": self.emergency_mode,
+            "decision": self.decision.state,
+            "user": self.decision.user,
+            "timestamp": datetime.datetime.now().isoformat(),
+        }
+        if self.door is not None:
+            status["door"] = self.door
+        self.bus.publish(f"{self.prefix}/status", json.dumps(status), qos=ACCESS_QOS, retain=True)
+
+    def publish_access(self, state, user):
+        self.bus.publish(f"{self.prefix}/access",
+                         json.dumps(access_event(state, user, self.door)), qos=ACCESS_QOS)
+        # Only a granted decision unlocks; denied or an empty doorway keeps it locked
+        self.is_locked = state != GRANTED
+        self.publish_status()
+
+    def publish_result(self, result):
+        self.bus.publish(f"{self.prefix}/recognition", json.dumps({
+            "seq": result.seq,
+            "timestamp": result.captured_at,
+            "name": result.recognized_name,
+            "recognized": result.is_recognized,
+            "boxes": [[int(x), int(y), int(size), name] for (x, y, size, name) in result.boxes],
+        }), qos=RESULT_QOS)
+
+    # =========== RUN LOOP ===========
+    def run(self, stop_event=None):
+        """Process frames until stop_event is set (or the source ends)"""
+        stop_event = stop_event or threading.Event()
+        self.publish_status()
+        self.metrics_publisher.start()
+        try:
+            while not stop_event.is_set():
+                cap = cv2.VideoCapture(self.source)
+                if cap.isOpened():
+                    self.process(cap, stop_event)
+                else:
+                    print(f"Unable to open camera source {self.source}")
+                cap.release()
+                if self.reopen_delay is None:
+                    break
+                stop_event.wait(self.reopen_delay)
+        finally:
+            self.metrics_publisher.stop()
+            self.bus.close()
+
+    def process(self, cap, stop_event):
+        # Video files have a fixed resolution and are read as fast as they decode
+        scheduler = None
+        if self.capture_scheduler and isinstance(self.source, int):
+            scheduler = CaptureScheduler(workers=self.workers)
+        pipeline = FramePipeline(
+            cap, self.recognizer, self.label_map,
+            publish_frame=lambda payload: self.bus.publish(f"{self.prefix}/camera", payload, qos=CAMERA_QOS),
+            detector_factory=self.detector_factory,
+            workers=self.workers,
+            stream_controller=AdaptiveStreamController(idle_fps=IDLE_STREAM_FPS),
+            metrics=self.metrics,
+            motion_gate=MotionGate() if self.motion_gate else None,
+            capture_scheduler=scheduler)
+        self.pipeline = pipeline
+        pipeline.start()
+        # A reload that finished while the pipeline was being built
+        pipeline.swap_model(self.recognizer, self.label_map)
+        print(f"Recognition running on camera source {self.source}")
+        try:
+            while not stop_event.is_set():
+                result = pipeline.get_result(timeout=0.5)
+                if result is None:
+                    if pipeline.capture_failed:
+                        print(f"Camera source {self.source} stopped delivering frames")
+                        break
+                    continue
+                with self.metrics.time("access"):
+                    change = self.decision.update(result.recognized_name, result.is_recognized)
+                    if change is not None:
+                        self.publish_access(*change)
+                self.publish_result(result)
+                # Face-in-view to result-published latency
+                self.metrics.observe("end_to_end", result.latency)
+        finally:
+            self.pipeline = None
+            pipeline.stop()
+            # Nobody can be seen while the camera is down
+            was_present = self.decision.state != NO_ONE
+            self.decision.reset()
+            if was_present:
+                self.publish_access(NO_ONE, None)
+
+
+def parse_source(source):
+    """Device index ("0") or video file path"""
+    return int(source) if source.isdigit() else source
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Headless face recognition service for one door")
+    parser.add_argument("--source", default="0", help="Camera index or video file")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--backend", choices=("opencv", "numpy"), default=RECOGNIZER_BACKEND)
+    parser.add_argument("--detection", choices=("full", "tracking"), default=DETECTION_MODE)
+    parser.add_argument("--workers", type=int, default=DETECTION_WORKERS)
+    parser.add_argument("--detect-every", type=int, default=DETECT_EVERY_N)
+    parser.add_argument("--detect-scale", type=float, default=DETECT_SCALE)
+    parser.add_argument("--no-motion-gate", action="store_true",
+                        help="Run detection on every frame even when nothing moves")
+    parser.add_argument("--no-capture-scheduler", action="store_true",
+                        help="Keep the camera at its default resolution and frame rate")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_HTTP_PORT,
+                        help="Also serve Prometheus text on this port")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    source = parse_source(args.source)
+    metrics = Metrics(enabled=METRICS_ENABLED)
+    if METRICS_ENABLED and args.metrics_port:
+        start_http_server(metrics, args.metrics_port)
+    service = RecognitionService(
+        source, host=args.host, port=args.port, backend=args.backend,
+        detection=args.detection, workers=args.workers,
+        detect_every=args.detect_every, detect_scale=args.detect_scale,
+        motion_gate=not args.no_motion_gate,
+        capture_scheduler=not args.no_capture_scheduler,
+        # Keep retrying a webcam; a video file just ends
+        reopen_delay=CAMERA_REOPEN_DELAY if isinstance(source, int) else None,
+        metrics=metrics)
+    stop_event = threading.Event()
+    try:
+        service.run(stop_event)
+    except KeyboardInterrupt:
+        print("Stopping recognition service...")
+        stop_event.set()
@@ -1,16 +1,27 @@
 import cv2
-import numpy as np
 import os
 import shutil
 import logging
 import threading
+import time
 import tkinter as tk
 from tkinter import font as tkFont
 from tkinter import messagebox, ttk
 from PIL import Image, ImageTk
-import paho.mqtt.client as mqtt
 import json
-import datetime
+import face_training
+from mqtt_bus import get_bus
+from enrollment import BurstSelector, BackgroundWriter
+from frame_pipeline import FrameRing
+
+# Burst enrollment samples this many times total_captures faces (or stops
+# after BURST_MAX_SECONDS) and keeps the best total_captures of them
+BURST_CANDIDATES_FACTOR = 3
+BURST_MAX_SECONDS = 15
+# Recent frames kept for the detection worker
+RING_SIZE = 8
+# Detection rate for the preview boxes while no burst is running
+PREVIEW_DETECT_FPS = 6
 
 # ==================================================================
 # Index:
@@ -33,10 +44,21 @@ class Face_Register:
         # Face/frame counters
         self.current_frame_faces_cnt = 0
         self.existing_faces_cnt = 0
-        self.ss_cnt = 0
-
-        self.mqtt_client = mqtt.Client("FaceRegister")
-        self.mqtt_client.connect("localhost", 1883)
+        self.ss_cnt = 0  # Frames the detection worker has run on
+
+        # Newest detection for the preview: (frame seq, face boxes)
+        self.latest_faces = (0, [])
+        self.shown_seq = 0
+        # Burst state shared between the Tk thread and the detection worker
+        self.burst = None
+        self.bursting = False
+        self.burst_lock = threading.Lock()
+        self.last_candidate = None
+        self.training = None  # face_training.TrainingJob while one runs
+        self.running = False
+        self.threads = []
+
+        self.bus = get_bus("FaceRegister")
 
         # Create main window
         self.win = tk.Tk()
@@ -89,49 +111,87 @@ class Face_Register:
         self.face_cascade = cv2.CascadeClassifier(
             cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
 
-        self.process()  # Start frame processing loop
-
-    # =========== PROCESS CAMERA FRAMES ===========
-    def process(self):
-        ret, frame = self.cap.read()
-        if not ret or frame is None:
-            print("Warning: Invalid frame received. Skipping...")
-            self.win.after(3, self.process)
-            return
+        # Pace the preview to the camera; many webcams report 0 fps
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if 1 <= fps <= 120 else 30
+        self.frames = FrameRing(RING_SIZE)
+        self.running = True
 
-        try:
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        except cv2.error:
-            print("Warning: Corrupt frame detected. Skipping...")
-            self.win.after(3, self.process)
-            return
+        # One capture thread fills the ring, one long-lived worker detects
+        self.threads = [threading.Thread(target=self.capture_frames, daemon=True),
+                        threading.Thread(target=self.detect_faces, daemon=True)]
+        for thread in self.threads:
+            thread.start()
 
-        # Run face detection in a separate thread
-        threading.Thread(target=self.detect_faces, args=(gray, frame)).start()
+        self.process()  # Start frame processing loop
 
-        # Show video frame in UI
-        img = Image.fromarray(rgb_frame)
-        img_tk = ImageTk.PhotoImage(image=img)
-        self.label.img_tk = img_tk
-        self.label.configure(image=img_tk)
+    # =========== PROCESS CAMERA FRAMES ===========
+    def capture_frames(self):
+        """Capture thread: the only reader of self.cap"""
+        while self.running:
+            ret, frame = self.cap.read()
+            if not ret or frame is None:
+                print("Warning: Invalid frame received. Skipping...")
+                time.sleep(0.1)
+                continue
+            self.frames.put(frame)
 
-        self.win.after(3, self.process)
+    def process(self):
+        """Preview on the Tk thread: newest frame plus the newest detection"""
+        seq, frame = self.frames.latest()
+        if frame is not None and seq != self.shown_seq:
+            self.shown_seq = seq
+            try:
+                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            except cv2.error:
+                print("Warning: Corrupt frame detected. Skipping...")
+                rgb_frame = None
+
+            if rgb_frame is not None:
+                face_seq, faces = self.latest_faces
+                # Boxes older than a few frames no longer match the picture
+                if seq - face_seq <= self.fps:
+                    for (x, y, w, h) in faces:
+                        cv2.rectangle(rgb_frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
+
+                # Show video frame in UI
+                img = Image.fromarray(rgb_frame)
+                img_tk = ImageTk.PhotoImage(image=img)
+                self.label.img_tk = img_tk
+                self.label.configure(image=img_tk)
+
+        if self.running:
+            self.win.after(max(1, int(1000 / self.fps)), self.process)
 
     # =========== DETECT FACES IN FRAME ===========
-    def detect_faces(self, gray_frame, frame):
-        if self.ss_cnt % 5 == 0:
+    def detect_faces(self):
+        """Detection worker: every frame during a burst, PREVIEW_DETECT_FPS otherwise"""
+        seq = 0
+        last_detect = 0
+        while self.running:
+            bursting = self.bursting
+            # A burst wants every frame in order; the preview only the newest
+            seq, frame = self.frames.next_after(seq, timeout=0.5, newest=not bursting)
+            if frame is None:
+                continue
+            if not bursting and time.time() - last_detect < 1.0 / PREVIEW_DETECT_FPS:
+                continue
+            last_detect = time.time()
+
+            gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
             faces = self.face_cascade.detectMultiScale(
                 gray_frame, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30)
             )
-        else:
-            faces = []
-
-        # Draw rectangles for debugging
-        for (x, y, w, h) in faces:
-            cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
+            self.latest_faces = (seq, [tuple(int(v) for v in f) for f in faces])
+            self.ss_cnt += 1
 
-        self.ss_cnt += 1
+            if bursting and len(faces):
+                # Only the largest face per frame: that is the person enrolling
+                (x, y, w, h) = max(faces, key=lambda f: f[2] * f[3])
+                face_img = gray_frame[y:y+h, x:x+w].copy()
+                with self.burst_lock:
+                    if self.bursting and self.burst.add(face_img):
+                        self.last_candidate = face_img
 
     # =========== START FACE CAPTURE ===========
     def capture_multiple_faces(self):
@@ -140,10 +200,17 @@ class Face_Register:
         if not name:
             messagebox.showerror("Error", "Please enter a name before capturing.")
             return
+        if self.is_training():
+            messagebox.showinfo("Info", "Please wait until training has finished.")
+            return
 
         self.capture_name = name
-        self.capture_index = 1
-        self.total_captures = 40  # Total images to collect
+        self.total_captures = 40  # Total images to keep
+        # Burst: sample faces at camera rate, then keep the best diverse ones
+        self.burst = BurstSelector(target=self.total_captures,
+                                   max_candidates=self.total_captures * BURST_CANDIDATES_FACTOR)
+        self.burst_started = time.time()
+        self.last_candidate = None
 
         # Create folders
         face_dir = "data/data_faces_from_camera"
@@ -153,102 +220,116 @@ class Face_Register:
 
         # Reset UI elements
         self.capture_label.config(text="")
+        self.progress_bar.config(maximum=self.burst.max_candidates)
         self.progress_bar["value"] = 0
         self.face_preview.configure(image='')
 
+        self.bursting = True
         self.capture_next_image()  # Start capture loop
 
     # =========== CAPTURE NEXT FACE ===========
     def capture_next_image(self):
-        if self.capture_index > self.total_captures:
-            self.capture_label.config(text="✅ Capture complete!")
-            self.train_recognizer()
-            return
-
-        ret, frame = self.cap.read()
-        if not ret or frame is None:
-            self.capture_label.config(text="❌ Failed to capture image.")
+        """Follow the burst from the Tk thread; the detection worker does the sampling"""
+        if self.burst.full or time.time() - self.burst_started > BURST_MAX_SECONDS:
+            self.finish_burst()
             return
 
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = self.face_cascade.detectMultiScale(
-            gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30)
-        )
-
-        if len(faces) == 0:
-            self.capture_label.config(text=f"❗ No face detected [{self.capture_index}/{self.total_captures}]")
+        count = len(self.burst.candidates)
+        if not self.latest_faces[1]:
+            self.capture_label.config(text=f"❗ No face detected [{count}/{self.burst.max_candidates}]")
         else:
-            for (x, y, w, h) in faces:
-                # Save face image
-                face_img = gray[y:y+h, x:x+w]
-                filename = os.path.join(self.person_dir, f"face_{self.capture_index}.jpg")
-                cv2.imwrite(filename, face_img)
-                print(f"[{self.capture_index}/{self.total_captures}] Saved: {filename}")
-
-                # Update UI
-                self.capture_label.config(text=f"📸 Captured {self.capture_index}/{self.total_captures}")
-                self.progress_bar["value"] = self.capture_index
-
-                # Show preview
-                face_preview_img = cv2.resize(face_img, (100, 100))
-                face_preview_img = cv2.cvtColor(face_preview_img, cv2.COLOR_GRAY2RGB)
-                img_tk = ImageTk.PhotoImage(image=Image.fromarray(face_preview_img))
-                self.face_preview.img_tk = img_tk
-                self.face_preview.configure(image=img_tk)
-
-                self.capture_index += 1  # Increment ONLY when a face is captured
-                break # Ensure only one face is captured per frame
-
-        self.win.after(500, self.capture_next_image)
+            self.capture_label.config(text=f"📸 Sampling {count}/{self.burst.max_candidates}")
+        self.progress_bar["value"] = count
+
+        # Show preview of the newest accepted face
+        face_img = self.last_candidate
+        if face_img is not None:
+            self.last_candidate = None
+            face_preview_img = cv2.resize(face_img, (100, 100))
+            face_preview_img = cv2.cvtColor(face_preview_img, cv2.COLOR_GRAY2RGB)
+            img_tk = ImageTk.PhotoImage(image=Image.fromarray(face_preview_img))
+            self.face_preview.img_tk = img_tk
+            self.face_preview.configure(image=img_tk)
+
+        self.win.after(100, self.capture_next_image)
+
+    def finish_burst(self):
+        with self.burst_lock:
+            self.bursting = False
+            faces = self.burst.select()
+        if not faces:
+            self.capture_label.config(text="❌ No usable face captured. Please try again.")
+            return
+        print(f"Burst: kept {len(faces)} of {len(self.burst.candidates)} candidates "
+              f"({self.burst.rejected} rejected) in {time.time() - self.burst_started:.1f}s")
+        self.capture_label.config(text=f"💾 Saving {len(faces)} best faces...")
+        self.writer = BackgroundWriter(self.person_dir, faces).start()
+        self.win.after(50, self.wait_for_writer)
+
+    def wait_for_writer(self):
+        if not self.writer.done:
+            self.win.after(50, self.wait_for_writer)
+            return
+        if self.writer.error is not None:
+            self.capture_label.config(text=f"❌ Failed to save faces: {self.writer.error}")
+            return
+        self.capture_label.config(text=f"✅ Capture complete! ({len(self.writer.paths)} faces)")
+        self.train_recognizer()
 
     # =========== TRAIN THE RECOGNIZER ===========
+    def is_training(self):
+        return self.training is not None and not self.training.done
+
     def train_recognizer(self):
-        # Get face images and labels
-        face_dir = "data/data_faces_from_camera"
-        recognizer = cv2.face.LBPHFaceRecognizer_create()
-        faces = []
-        labels = []
-        label_ids = {}
-        current_id = 0
-
-        for person_dir in os.listdir(face_dir):
-            person_path = os.path.join(face_dir, person_dir)
-            if not os.path.isdir(person_path):
-                continue  # Skip if not a directory
-
-            label_ids[person_dir] = current_id
-            current_id += 1
-
-            for file in os.listdir(person_path):
-                if not file.endswith((".png", ".jpg", ".jpeg")):
-                    continue  # Skip non-image files
-                path = os.path.join(person_path, file)
-                img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
-                faces.append(img)
-                labels.append(label_ids[person_dir])
-
-        if len(faces) > 0:
-            recognizer.train(faces, np.array(labels))
-            recognizer.save("data/trained_model.yml")
-
-            # Save label-to-ID mapping
-            with open("data/label_mapping.txt", "w") as f:
-                for name, id in label_ids.items():
-                    f.write(f"{name},{id}\n")
+        # Only new or changed images are processed (face_dataset caches the
+        # rest), by a thread pool off the Tk thread.
+        self.capture_label.config(text="🧠 Training...")
+        self.progress_bar["value"] = 0
+        self.training = face_training.TrainingJob().start()
+        self.win.after(100, self.wait_for_training)
+
+    def wait_for_training(self):
+        done, total = self.training.progress
+        if not self.training.done:
+            if total and done < total:
+                self.capture_label.config(text=f"🧠 Loading faces {done}/{total}")
+                self.progress_bar.config(maximum=total)
+                self.progress_bar["value"] = done
+            else:
+                self.capture_label.config(text="🧠 Training...")
+            self.win.after(100, self.wait_for_training)
+            return
 
-            # System update and user creation log
-            self.mqtt_client.publish("smartlock/system",
-                                   json.dumps({
-                                       "type": "log",
-                                       "message": f"User: {self.capture_name} created"
-                                   }))
+        self.progress_bar["value"] = self.progress_bar["maximum"]
+        if self.training.error is not None:
+            print(f"❌ Training failed: {self.training.error}")
+            self.capture_label.config(text=f"❌ Training failed: {self.training.error}")
+            return
+        label_ids = self.training.result
 
+        if label_ids:
+            # System update and user creation log
+            self.bus.publish("smartlock/system",
+                             json.dumps({
+                                 "type": "log",
+                                 "message": f"User: {self.capture_name} created"
+                             }))
+
+            self.announce_model()
+            self.capture_label.config(text=f"✅ {self.capture_name} enrolled")
             print("✅ Face recognizer trained successfully!")
         else:
             print("⚠️ No faces found for training!")
 
+    def announce_model(self):
+        """Tell running recognition services to load the new model (retained, so late starters see it too)"""
+        self.bus.publish("smartlock/model", json.dumps(face_training.model_event()), qos=2, retain=True)
+
     # ====================== CLEAR ALL DATA ======================
     def clear_data(self):
+        if self.is_training():
+            messagebox.showinfo("Info", "Please wait until training has finished.")
+            return
         face_dir = "data/data_faces_from_camera/"
         if os.path.exists(face_dir):
             shutil.rmtree(face_dir)
@@ -256,16 +337,25 @@ class Face_Register:
 
             if os.path.exists("data/trained_model.yml"):
                 os.remove("data/trained_model.yml")
+            if os.path.exists("data/trained_model.lbpg"):
+                os.remove("data/trained_model.lbpg")
+            if os.path.exists("data/face_dataset.fds"):
+                os.remove("data/face_dataset.fds")
             if os.path.exists("data/label_mapping.txt"):
                 os.remove("data/label_mapping.txt")
 
+            self.announce_model()
             messagebox.showinfo("Success", "All face data has been cleared.")
         else:
             messagebox.showinfo("Info", "No face data to clear.")
 
     # ====================== EXIT CLEANLY ======================
     def exit_program(self):
-        self.mqtt_client.disconnect()
+        self.running = False
+        self.bursting = False
+        for thread in self.threads:
+            thread.join(timeout=1)
+        self.bus.close()
         self.cap.release()
         cv2.destroyAllWindows()
         self.win.quit()
@@ -1,8 +1,12 @@
-import paho.mqtt.client as mqtt
 import json
 import datetime
 import logging
 import time
+from event_store import EventStore
+from mqtt_bus import get_bus
+
+# Full-fidelity event history in attendance.db (written off the MQTT thread)
+event_store = EventStore("attendance.db")
 
 # Track last message times by type to avoid log overcrowding
 last_message_times = {
@@ -14,33 +18,42 @@ last_message_times = {
 }
 MESSAGE_INTERVAL = 60  # 1 minute interval for all log types
 
-def on_connect(client, userdata, flags, rc):
-    print("Connected to MQTT broker")
-    client.subscribe([
-        ("smartlock/access", 2),  # Access events - QoS 2
-        ("smartlock/system", 2),  # System logs - QoS 2
-        ("smartlock/control", 2)   # Control commands - QoS 2
-    ])
+SUBSCRIPTIONS = [
+    ("smartlock/access", 2),  # Access events - QoS 2
+    ("smartlock/+/access", 2),  # Per-door access events from multi_camera.py - QoS 2
+    ("smartlock/system", 2),  # System logs - QoS 2
+    ("smartlock/control", 2),  # Control commands - QoS 2
+    ("smartlock/+/control", 2)  # Per-door control commands - QoS 2
+]
+
+bus = None
 
 def on_message(client, userdata, msg):
     try:
         data = json.loads(msg.payload)
         current_time = time.time()
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # Republished events carry the door (None for the single-door setup)
+        # so a viewer started with --door only shows its own
+        door = data.get("door") or topic_door(msg.topic)
+
+        # Every event is persisted; only the text log below is rate limited
+        store_event(msg.topic, data, current_time)
         
-        if msg.topic == "smartlock/access" and data["type"] == "access":
+        if is_access_topic(msg.topic) and data["type"] == "access":
             if data["authorized"]:
                 # Apply rate limiting to authorized user logs
                 if current_time - last_message_times["authorized_user"] >= MESSAGE_INTERVAL:
-                    log_message = f"{data['user']} unlocked door at {timestamp}"
+                    log_message = f"{data['user']} unlocked {data.get('door', 'door')} at {timestamp}"
                     logging.info(log_message)
                     last_message_times["authorized_user"] = current_time
                 
                 # Republish as system event (no rate limiting for events)
-                client.publish("smartlock/events", json.dumps({
+                bus.publish("smartlock/events", json.dumps({
                     "name": data['user'],
                     "status": "granted",
-                    "timestamp": timestamp
+                    "timestamp": timestamp,
+                    "door": door
                 }), qos=2)  # Events - QoS 2
             else:
                 # Rate limiting for unknown user logs
@@ -50,13 +63,14 @@ def on_message(client, userdata, msg):
                     last_message_times["unknown_user"] = current_time
                     
                     # Republish as system event
-                    client.publish("smartlock/events", json.dumps({
+                    bus.publish("smartlock/events", json.dumps({
                         "name": "Unknown",
                         "status": "denied",
-                        "timestamp": timestamp
+                        "timestamp": timestamp,
+                        "door": door
                     }))
         
-        elif msg.topic == "smartlock/control" and data.get("source") == "admin":
+        elif is_control_topic(msg.topic) and data.get("source") == "admin":
             # Log admin actions with rate limiting
             if data["command"] == "unlock":
                 if current_time - last_message_times["admin_allow"] >= MESSAGE_INTERVAL:
@@ -65,17 +79,19 @@ def on_message(client, userdata, msg):
                     last_message_times["admin_allow"] = current_time
                 
                 # Send notification to face recognition app with custom message
-                client.publish("smartlock/admin_action", json.dumps({
+                bus.publish("smartlock/admin_action", json.dumps({
                     "action": "allowed",
                     "message": "Allowed by admin.",
-                    "timestamp": timestamp
+                    "timestamp": timestamp,
+                    "door": door
                 }))
                 
                 # Log as event
-                client.publish("smartlock/events", json.dumps({
+                bus.publish("smartlock/events", json.dumps({
                     "name": "Unknown (Admin Override)",
                     "status": "granted",
-                    "timestamp": timestamp
+                    "timestamp": timestamp,
+                    "door": door
                 }))
                 
             elif data["command"] == "lockdown":
@@ -85,17 +101,19 @@ def on_message(client, userdata, msg):
                     last_message_times["admin_deny"] = current_time
                 
                 # Send notification to face recognition app with emergency message
-                client.publish("smartlock/admin_action", json.dumps({
+                bus.publish("smartlock/admin_action", json.dumps({
                     "action": "denied",
                     "message": "Denied by admin. Contacting emergency services.",
-                    "timestamp": timestamp
+                    "timestamp": timestamp,
+                    "door": door
                 }))
                 
                 # Log as event
-                client.publish("smartlock/events", json.dumps({
+                bus.publish("smartlock/events", json.dumps({
                     "name": "Unknown (Admin Denied)",
                     "status": "denied",
-                    "timestamp": timestamp
+                    "timestamp": timestamp,
+                    "door": door
                 }))
         
         elif msg.topic == "smartlock/system" and data.get("type") == "log":
@@ -110,6 +128,37 @@ def on_message(client, userdata, msg):
     except Exception as e:
         logging.error(f"Error processing message: {e}")
 
+def is_access_topic(topic):
+    """smartlock/access or a per-door smartlock/<door>/access"""
+    return topic == "smartlock/access" or (topic.startswith("smartlock/") and topic.endswith("/access"))
+
+def is_control_topic(topic):
+    """smartlock/control or a per-door smartlock/<door>/control"""
+    return topic == "smartlock/control" or (topic.startswith("smartlock/") and topic.endswith("/control"))
+
+def topic_door(topic):
+    """Door name of a per-door smartlock/<door>/... topic, else None"""
+    parts = topic.split("/")
+    return parts[1] if len(parts) == 3 else None
+
+def store_event(topic, data, current_time):
+    if is_access_topic(topic):
+        if data.get("type") == "access":
+            event_store.record("access", topic, user=data.get("user"),
+                               outcome="granted" if data.get("authorized") else "denied",
+                               door=data.get("door"), payload=data, ts=current_time)
+        else:
+            event_store.record("presence", topic, outcome=data.get("decision"),
+                               door=data.get("door"), payload=data, ts=current_time)
+    elif is_control_topic(topic):
+        # The user column holds who issued the command (e.g. "admin")
+        event_store.record("control", topic, user=data.get("source"), outcome=data.get("command"),
+                           message=data.get("message"), door=topic_door(topic),
+                           payload=data, ts=current_time)
+    elif topic == "smartlock/system":
+        event_store.record("system", topic, message=data.get("message"),
+                           payload=data, ts=current_time)
+
 def start_logger():
     logging.basicConfig(
         filename='smartlock_access.log',
@@ -117,12 +166,13 @@ def start_logger():
         format='%(asctime)s - %(message)s'
     )
     
-    client = mqtt.Client("SystemLogger")
-    client.on_connect = on_connect
-    client.on_message = on_message
-    
-    client.connect("localhost", 1883)
-    client.loop_start()
+    event_store.start()
+
+    # Shared MQTT bus: reconnects and resubscribes on its own
+    global bus
+    bus = get_bus("SystemLogger")
+    for topic, qos in SUBSCRIPTIONS:
+        bus.subscribe(topic, qos, on_message)
 
 if __name__ == "__main__":
     start_logger()
@@ -132,4 +182,6 @@ if __name__ == "__main__":
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
-        print("Shutting down logger...")
\ No newline at end of file
+        print("Shutting down logger...")
+        bus.close()
+        event_store.close()
\ No newline at end of file
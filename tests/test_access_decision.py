@@ -0,0 +1,81 @@
+# tests/test_access_decision.py
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from access_decision import AccessDecision, GRANTED, DENIED, NO_ONE  # noqa: E402
+from frame_pipeline import CONFIDENCE_THRESHOLD, recognize_faces  # noqa: E402
+
+LABEL_MAP = {0: "Alice", 1: "Bob"}
+
+
+class FixedRecognizer:
+    """Returns preset (label, confidence) predictions, one per face"""
+
+    def __init__(self, predictions):
+        self.predictions = predictions
+
+    def predict_batch(self, faces):
+        assert len(faces) == len(self.predictions)
+        return list(self.predictions)
+
+
+def recognize(predictions):
+    gray = np.zeros((240, 320), np.uint8)
+    faces = [(10 + 100 * i, 20, 60, 60) for i in range(len(predictions))]
+    return recognize_faces(gray, faces, FixedRecognizer(predictions), LABEL_MAP)
+
+
+def test_known_user_next_to_unknown_face_is_recognized():
+    unknown = (1, CONFIDENCE_THRESHOLD + 10)
+    for predictions in ([(0, 20.0), unknown], [unknown, (0, 20.0)]):
+        boxes, name, recognized = recognize(predictions)
+        assert (name, recognized) == ("Alice", True)
+        assert sorted(box[3] for box in boxes) == ["Alice", "Unknown"]
+
+
+def test_best_match_wins_between_known_users():
+    _, name, recognized = recognize([(1, 50.0), (0, 20.0)])
+    assert (name, recognized) == ("Alice", True)
+
+
+def test_only_unknown_faces_and_empty_frames():
+    assert recognize([(0, CONFIDENCE_THRESHOLD + 1)])[1:] == ("Unknown", False)
+    assert recognize([(7, 10.0)])[1:] == ("Unknown", False)  # label not in the map
+    assert recognize([])[1:] == (None, False)
+
+
+def test_decision_needs_min_votes():
+    decision = AccessDecision(window=10, min_votes=6)
+    changes = [decision.update("Alice", True) for _ in range(6)]
+    assert changes[:5] == [None] * 5
+    assert changes[5] == (GRANTED, "Alice")
+    # Further agreeing votes are not new transitions
+    assert decision.update("Alice", True) is None
+
+
+def test_single_misread_frame_does_not_flip_state():
+    decision = AccessDecision(window=10, min_votes=6)
+    for _ in range(8):
+        decision.update("Alice", True)
+    assert decision.update("Unknown", False) is None
+    assert decision.update(None, False) is None
+    assert decision.state == GRANTED
+
+
+def test_mixed_frame_votes_grant_the_known_user():
+    decision = AccessDecision(window=10, min_votes=6)
+    changes = []
+    for _ in range(6):
+        _, name, recognized = recognize([(0, 20.0), (1, CONFIDENCE_THRESHOLD + 10)])
+        changes.append(decision.update(name, recognized))
+    assert changes[-1] == (GRANTED, "Alice")
+
+
+def test_denied_then_clear():
+    decision = AccessDecision(window=4, min_votes=3)
+    results = [decision.update("Unknown", False) for _ in range(3)]
+    assert results[-1] == (DENIED, None)
+    results = [decision.update(None, False) for _ in range(3)]
+    assert results[-1] == (NO_ONE, None)
@@ -0,0 +1,111 @@
+# tests/test_face_dataset.py
+import os
+import sys
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import face_dataset  # noqa: E402
+import face_training  # noqa: E402
+
+
+def write_face(path, seed):
+    rng = np.random.default_rng(seed)
+    cv2.imwrite(str(path), rng.integers(0, 256, (160, 160), dtype=np.uint8))
+
+
+def enroll(face_dir, name, count, seed=0):
+    person_dir = face_dir / name
+    person_dir.mkdir(parents=True, exist_ok=True)
+    for i in range(count):
+        write_face(person_dir / f"face_{i + 1}.png", seed + i)
+
+
+@pytest.fixture
+def paths(tmp_path):
+    face_dir = tmp_path / "faces"
+    enroll(face_dir, "Alice", 3, seed=0)
+    enroll(face_dir, "Bob", 2, seed=100)
+    return face_dir, str(tmp_path / "faces.fds")
+
+
+@pytest.fixture
+def decoded(monkeypatch):
+    """Paths handed to _process_file, i.e. images that were hashed and decoded"""
+    calls = []
+    process_file = face_dataset._process_file
+
+    def counting(path, known_hashes):
+        calls.append(os.path.basename(path))
+        return process_file(path, known_hashes)
+    monkeypatch.setattr(face_dataset, "_process_file", counting)
+    return calls
+
+
+def test_unchanged_files_are_not_decoded_again(paths, decoded):
+    face_dir, dataset_path = paths
+    dataset = face_dataset.sync(face_dir, dataset_path)
+    assert len(decoded) == 5
+    assert dataset.names() == ["Alice", "Bob"]
+
+    mtime = os.path.getmtime(dataset_path)
+    decoded.clear()
+    dataset = face_dataset.sync(face_dir, dataset_path)
+    assert decoded == []
+    assert len(dataset) == 5
+    assert os.path.getmtime(dataset_path) == mtime
+
+    write_face(face_dir / "Bob" / "face_3.png", 200)
+    dataset = face_dataset.sync(face_dir, dataset_path)
+    assert decoded == ["face_3.png"]
+    assert len(dataset.faces("Bob")) == 3
+
+
+def test_deleted_people_and_files_are_evicted(paths):
+    face_dir, dataset_path = paths
+    face_dataset.sync(face_dir, dataset_path)
+
+    for file in os.listdir(face_dir / "Bob"):
+        os.remove(face_dir / "Bob" / file)
+    os.rmdir(face_dir / "Bob")
+    os.remove(face_dir / "Alice" / "face_2.png")
+    dataset = face_dataset.sync(face_dir, dataset_path)
+    assert dataset.names() == ["Alice"]
+    assert [record[1] for record in dataset.file_records()] == ["face_1.png", "face_3.png"]
+
+
+def test_unreadable_image_is_not_retried_until_it_changes(paths, decoded):
+    face_dir, dataset_path = paths
+    broken = face_dir / "Alice" / "face_9.jpg"
+    broken.write_bytes(b"not an image")
+    dataset = face_dataset.sync(face_dir, dataset_path)
+    assert len(dataset.faces("Alice")) == 3
+    assert ("Alice", "face_9.jpg") in dataset.failed_records()
+
+    mtime = os.path.getmtime(dataset_path)
+    decoded.clear()
+    face_dataset.sync(face_dir, dataset_path)
+    assert decoded == []
+    assert os.path.getmtime(dataset_path) == mtime
+
+    write_face(broken, 300)
+    dataset = face_dataset.sync(face_dir, dataset_path)
+    assert decoded == ["face_9.jpg"]
+    assert len(dataset.faces("Alice")) == 4
+    assert dataset.failed_records() == {}
+
+
+def test_retrain_keeps_existing_label_ids(paths, tmp_path):
+    face_dir, dataset_path = paths
+    files = {"face_dir": str(face_dir), "dataset_path": dataset_path,
+             "model_path": str(tmp_path / "model.yml"), "label_path": str(tmp_path / "labels.txt")}
+    assert face_training.train_full(prototypes=0, **files) == {"Alice": 0, "Bob": 1}
+
+    enroll(face_dir, "Aaron", 2, seed=400)
+    for file in os.listdir(face_dir / "Alice"):
+        os.remove(face_dir / "Alice" / file)
+    os.rmdir(face_dir / "Alice")
+    label_ids = face_training.train_full(prototypes=0, **files)
+    assert label_ids == {"Aaron": 2, "Bob": 1}
+    assert face_training.load_label_ids(files["label_path"]) == label_ids
@@ -0,0 +1,46 @@
+# tests/test_face_tracking.py
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from face_tracking import TrackingDetector  # noqa: E402
+
+
+class CountingCascade:
+    """Stands in for a CascadeClassifier, returning preset faces"""
+
+    def __init__(self):
+        self.faces = []
+        self.calls = 0
+
+    def detectMultiScale(self, image, **params):
+        self.calls += 1
+        return list(self.faces)
+
+
+def test_reset_runs_the_cascade_on_the_next_frame():
+    cascade = CountingCascade()
+    detector = TrackingDetector(cascade, detect_every=5)
+    frame = np.zeros((240, 320), np.uint8)
+
+    # Nobody in view: the empty track list carries the cadence
+    detector.detect(frame)
+    detector.detect(frame)
+    assert cascade.calls == 1
+
+    # A face appears while the motion gate is closed; the wakeup resets the
+    # tracker, so the cascade finds it on the very next frame
+    cascade.faces = [(40, 30, 40, 40)]
+    detector.reset()
+    assert detector.detect(frame) == [(80, 60, 80, 80)]
+    assert cascade.calls == 2
+
+
+def test_without_reset_the_cadence_is_kept():
+    cascade = CountingCascade()
+    detector = TrackingDetector(cascade, detect_every=3)
+    frame = np.zeros((240, 320), np.uint8)
+    for _ in range(6):
+        detector.detect(frame)
+    assert cascade.calls == 2
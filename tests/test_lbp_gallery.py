@@ -0,0 +1,94 @@
+# tests/test_lbp_gallery.py
+import os
+import sys
+import glob
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lbp_gallery import HIST_SIZE, SHORTLIST_MIN_USERS, LBPGallery  # noqa: E402
+
+FACES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                         "data", "data_faces_from_camera")
+# Distances are summed in a different order than OpenCV's, in float32
+CONFIDENCE_TOLERANCE = 1e-2
+
+
+def load_faces():
+    """(train images, train labels, test images) from the enrollment folders"""
+    train, labels, test = [], [], []
+    for label, person in enumerate(sorted(os.listdir(FACES_DIR))):
+        paths = sorted(glob.glob(os.path.join(FACES_DIR, person, "*.jpg")))
+        for i, path in enumerate(paths):
+            image = cv2.resize(cv2.imread(path, cv2.IMREAD_GRAYSCALE), (100, 100))
+            if i % 4 == 0:
+                test.append(image)
+            else:
+                train.append(image)
+                labels.append(label)
+    return train, np.array(labels, dtype=np.int32), test
+
+
+@pytest.fixture(scope="module")
+def trained():
+    if not hasattr(cv2, "face") or not os.path.isdir(FACES_DIR):
+        pytest.skip("needs opencv-contrib and the enrollment images")
+    train, labels, test = load_faces()
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    recognizer.train(train, labels)
+    return recognizer, LBPGallery.from_images(train, labels), test
+
+
+def test_histograms_match_opencv(trained):
+    recognizer, gallery, _ = trained
+    expected = np.vstack([h.reshape(1, -1) for h in recognizer.getHistograms()])
+    np.testing.assert_allclose(gallery.histograms, expected, rtol=0, atol=1e-6)
+
+
+def test_predictions_match_opencv(trained):
+    recognizer, gallery, test = trained
+    results = gallery.predict_batch(test)
+    for face, (label, confidence) in zip(test, results):
+        expected_label, expected_confidence = recognizer.predict(face)
+        assert label == expected_label
+        assert confidence == pytest.approx(expected_confidence, abs=CONFIDENCE_TOLERANCE)
+
+
+def test_from_recognizer_matches_opencv(trained):
+    recognizer, _, test = trained
+    gallery = LBPGallery.from_recognizer(recognizer)
+    for face in test[:5]:
+        label, confidence = gallery.predict(face)
+        expected_label, expected_confidence = recognizer.predict(face)
+        assert label == expected_label
+        assert confidence == pytest.approx(expected_confidence, abs=CONFIDENCE_TOLERANCE)
+
+
+def synthetic_gallery(people, samples, interleaved, seed=0):
+    """(gallery, queries, query labels): noisy copies of one sparse random histogram per person"""
+    rng = np.random.default_rng(seed)
+    bases = rng.random((people, HIST_SIZE), dtype=np.float32)
+    bases[rng.random(bases.shape) > 0.2] = 0
+    labels = np.repeat(np.arange(people, dtype=np.int32), samples)
+    if interleaved:
+        labels = rng.permutation(labels)
+    noise = rng.uniform(0.7, 1.3, (len(labels), HIST_SIZE)).astype(np.float32)
+    gallery = LBPGallery(bases[labels] * noise, labels)
+    query_labels = rng.integers(0, people, 12)
+    queries = bases[query_labels] * rng.uniform(0.7, 1.3, (12, HIST_SIZE)).astype(np.float32)
+    return gallery, queries, query_labels
+
+
+@pytest.mark.parametrize("interleaved", [False, True])
+def test_shortlist_matches_exhaustive_search(interleaved):
+    gallery, queries, query_labels = synthetic_gallery(SHORTLIST_MIN_USERS + 10, 4, interleaved)
+    shortlisted = gallery.predict_histograms(queries)
+    assert gallery.user_index is not None  # the two-stage path was taken
+
+    gallery.shortlist = 0
+    exhaustive = gallery.predict_histograms(queries)
+    assert [label for label, _ in shortlisted] == [label for label, _ in exhaustive]
+    assert [label for label, _ in exhaustive] == list(query_labels)
+    for (_, confidence), (_, expected) in zip(shortlisted, exhaustive):
+        assert confidence == pytest.approx(expected, rel=1e-6)